@@ -0,0 +1,87 @@
+"""
+animations.py
+Animation lifecycle registry shared by the Kivy apps.
+
+Kivy happily runs any number of Animations on the same widget property at once, and a
+repeating Sequence never completes on its own. AnimationRegistry keeps at most one live
+animation per (target, property): starting a new one cancels whatever was animating those
+properties, starting an identical one reuses the running animation, and stats() reports
+how many are live. cancel(finish=True) also leaves each property at the animation's end
+value, so a transition cut short (e.g. on pause) doesn't leave a half-faded widget.
+"""
+
+
+class AnimationRegistry:
+    """One live animation per (target, property); see the module docstring."""
+
+    def __init__(self):
+        self._live = {}  # (target, property name) -> Animation
+        self.started = 0
+        self.reused = 0
+        self.cancelled = 0
+
+    def start(self, target, anim, on_complete=None):
+        """Start `anim` on `target`, replacing (or reusing) what animates the same properties."""
+        props = list(anim.animated_properties)
+        current = []
+        for p in props:
+            old = self._live.get((target, p))
+            if old is not None and old not in current:
+                current.append(old)
+
+        if len(current) == 1 and self._same(current[0], anim) \
+                and all(self._live.get((target, p)) is current[0] for p in props):
+            self.reused += 1
+            return current[0]
+
+        for old in current:
+            old.cancel(target)
+            self._forget(target, old)
+            self.cancelled += 1
+
+        for p in props:
+            self._live[(target, p)] = anim
+        anim.bind(on_complete=lambda a, widget: self._forget(widget, a))
+        if on_complete is not None:
+            anim.bind(on_complete=on_complete)
+        anim.start(target)
+        self.started += 1
+        return anim
+
+    def cancel(self, target=None, finish=False):
+        """Cancel every registered animation (on `target` only, if given); with finish, jump to the end values."""
+        for (t, _p), anim in list(self._live.items()):
+            if target is not None and t is not target:
+                continue
+            if self._forget(t, anim):
+                anim.cancel(t)
+                self.cancelled += 1
+                if finish:
+                    self.finish_values(t, anim)
+
+    @staticmethod
+    def finish_values(target, anim):
+        """Set target's animated properties to where `anim` ends (the last step, for a sequence)."""
+        for name, value in anim.animated_properties.items():
+            try:
+                setattr(target, name, value)
+            except Exception:
+                pass
+
+    def live(self):
+        return len({(id(t), id(a)) for (t, _p), a in self._live.items()})
+
+    def stats(self):
+        return {"live": self.live(), "started": self.started, "reused": self.reused,
+                "cancelled": self.cancelled}
+
+    def _forget(self, target, anim):
+        keys = [k for k, a in self._live.items() if a is anim and k[0] is target]
+        for k in keys:
+            del self._live[k]
+        return bool(keys)
+
+    @staticmethod
+    def _same(a, b):
+        return (a.animated_properties == b.animated_properties and a.duration == b.duration
+                and getattr(a, "repeat", False) == getattr(b, "repeat", False))
@@ -0,0 +1,53 @@
+"""
+bench_import.py
+Import-time benchmark for the GUI-free core vs. the Kivy apps.
+
+Each module is imported in a fresh interpreter (`python -X importtime -c "import m"`)
+and the cumulative import time reported by CPython is collected; the median over
+--runs is printed. Modules that can't be imported here (e.g. Kivy not installed,
+no display) are reported as skipped.
+
+    python bench_import.py               # weather_core, weather_batch, space, spaceweather
+    python bench_import.py weather_core --runs 20
+"""
+
+import argparse, os, statistics, subprocess, sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODULES = ["weather_core", "weather_batch", "space", "spaceweather"]
+
+
+def import_time_us(module):
+    """Cumulative import time of `module` in microseconds, measured in a fresh interpreter."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=HERE, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    for line in reversed(proc.stderr.splitlines()):
+        # "import time:   self [us] | cumulative | imported package"
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise RuntimeError("no importtime line for module")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    ap.add_argument("--runs", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    for module in args.modules:
+        try:
+            import_time_us(module)  # warm-up: writes the .pyc so compile time isn't measured
+            samples = [import_time_us(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<14} skipped ({e})")
+            continue
+        print(f"{module:<14} median {statistics.median(samples) / 1000:8.2f} ms"
+              f"   min {min(samples) / 1000:8.2f} ms   ({args.runs} runs)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+citysearch.py
+Type-ahead suggestions for the city box, shared by the Kivy apps.
+
+Every edit of city_input shows matches from previous searches and the offline
+gazetteer straight away (no network). Only when nothing local matches and the user
+stops typing for SUGGEST_DEBOUNCE seconds is the text geocoded online; any further
+edit cancels that lookup, so at most one call per pause is made and a stale answer
+is never shown. Picking a suggestion refreshes with its coordinates directly, without
+another geocode.
+
+The app provides `pipeline` (weather_core.RefreshPipeline) and a TextInput with id
+city_input whose on_text calls on_city_text(self).
+"""
+
+from kivy.clock import Clock, mainthread
+from kivy.metrics import dp
+from kivy.uix.button import Button
+from kivy.uix.dropdown import DropDown
+
+from weather_core import PRIORITY_USER, suggestion_label
+
+# ----- CONFIG -----
+SUGGEST_DEBOUNCE = 0.35  # seconds of no typing before a network lookup
+
+
+class CitySearchMixin:
+    _suggest_event = None
+    _suggest_dropdown = None
+    _suggest_muted = False
+
+    def on_city_text(self, text_input):
+        if self._suggest_muted:
+            return
+        if self._suggest_event is not None:
+            self._suggest_event.cancel()
+            self._suggest_event = None
+        suggester = self.pipeline.suggester
+        suggester.cancel()
+        text = text_input.text
+        places = suggester.local(text)
+        self._show_suggestions(text_input, places)
+        if not places:
+            self._suggest_event = Clock.schedule_once(
+                lambda dt: suggester.lookup(text, self._network_suggestions), SUGGEST_DEBOUNCE)
+
+    @mainthread
+    def _network_suggestions(self, text, places):
+        city_input = self.root.ids.city_input
+        if city_input.text == text:
+            self._show_suggestions(city_input, places)
+
+    def _show_suggestions(self, text_input, places):
+        if self._suggest_dropdown is None:
+            self._suggest_dropdown = DropDown(max_height=dp(240))
+        dropdown = self._suggest_dropdown
+        dropdown.clear_widgets()
+        if not places or not text_input.focus:
+            dropdown.dismiss()
+            return
+        for place in places:
+            btn = Button(text=suggestion_label(place), size_hint_y=None, height=dp(36), font_size='13sp',
+                         background_normal='', background_color=(0.08, 0.09, 0.11, 0.98), color=(1, 1, 1, 0.95))
+            btn.bind(on_release=lambda _btn, p=place: self.pick_suggestion(p))
+            dropdown.add_widget(btn)
+        if dropdown.parent is None:
+            dropdown.open(text_input)
+
+    def pick_suggestion(self, place):
+        lat, lon, name, region, country = place
+        self._suggest_muted = True
+        try:
+            self.root.ids.city_input.text = suggestion_label(place)
+        finally:
+            self._suggest_muted = False
+        self.dismiss_suggestions()
+        self.pipeline.request_refresh(supersede=True, priority=PRIORITY_USER, lat_override=lat, lon_override=lon,
+                                      city=name, region=region or country)
+
+    def dismiss_suggestions(self):
+        if self._suggest_event is not None:
+            self._suggest_event.cancel()
+            self._suggest_event = None
+        self.pipeline.suggester.cancel()
+        if self._suggest_dropdown is not None:
+            self._suggest_dropdown.dismiss()
+
+    def suggestion_stats(self):
+        """Text changes, local answers, geocoding calls made / avoided, cancelled and stale lookups."""
+        return self.pipeline.suggester.stats()
@@ -0,0 +1,297 @@
+"""
+gazetteer.py
+Offline city lookup and type-ahead suggestions, without a geocoding round-trip.
+
+The bundled cities.csv (name, region, country, lat, lon, population) is compiled once
+into a binary index under the home directory and then memory-mapped:
+
+- records sorted by normalized name (casefolded, accents and punctuation dropped), so
+  a prefix is a contiguous range found by binary search;
+- a prefix table with the most populous matches for every 1..PREFIX_DEPTH character
+  prefix, so short prefixes (the ones with thousands of matches) are a single lookup.
+
+suggest("lon") returns population-ranked (lat, lon, name, region, country) tuples in
+well under a millisecond; lookup("London, GB") resolves a typed search exactly, and
+RefreshPipeline.collect_city only geocodes online when it returns None. A larger list
+can be dropped in from a GeoNames dump: `python gazetteer.py cities15000.txt`. City data
+comes from GeoNames (geonames.org, CC BY 4.0); keep the attribution in the README.
+
+GUI-free.
+"""
+
+import csv, heapq, mmap, os, struct, tempfile, threading, unicodedata
+
+# ----- CONFIG -----
+GAZETTEER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cities.csv")
+GAZETTEER_INDEX = os.path.join(os.path.expanduser("~"), ".spaceweather_gazetteer.idx")
+PREFIX_DEPTH = 4  # prefixes up to this length are answered from the precomputed table
+PREFIX_TOP = 8  # suggestions kept per table prefix
+SUGGEST_LIMIT = 8
+
+_HEADER = struct.Struct("<4sHHIIIII")  # magic, version, prefix depth, records, prefixes, 3 section offsets
+_HEADER_SIZE = 32
+_RECORD = struct.Struct("<IHHffI")  # string offset, key length, label length, lat, lon, population
+_MAGIC = b"WXGZ"
+_VERSION = 1
+_NONE = 0xFFFFFFFF
+_SEP = "\x1f"  # between name, region and country in a record's label
+
+
+def normalize(text):
+    """Search key for a place name: ASCII, lowercase, single spaces ("São Paulo" -> "sao paulo")."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii").casefold()
+    text = text.replace("'", "").replace("`", "")
+    return " ".join("".join(c if c.isalnum() else " " for c in text).split())
+
+
+def _prefix_row(depth):
+    return struct.Struct(f"<{depth}s{PREFIX_TOP}I")
+
+
+# ----- Building -----
+def read_cities_csv(path):
+    """(name, region, country, lat, lon, population) rows from the bundled CSV layout."""
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                yield (row["name"], row.get("region", ""), row.get("country", ""),
+                       float(row["lat"]), float(row["lon"]), int(row.get("population") or 0))
+            except (KeyError, ValueError):
+                continue
+
+
+def read_geonames(path):
+    """The same rows from a GeoNames citiesNNNN.txt dump (tab-separated, no header)."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15:
+                continue
+            admin1 = cols[10] if cols[10].isalpha() else ""  # numeric admin codes mean nothing on screen
+            try:
+                yield cols[1], admin1, cols[8], float(cols[4]), float(cols[5]), int(cols[14] or 0)
+            except ValueError:
+                continue
+
+
+def build_index(source=GAZETTEER_SOURCE, dest=GAZETTEER_INDEX, depth=PREFIX_DEPTH):
+    """Compile `source` (.csv, or a GeoNames .txt dump) into the binary index at `dest`; returns the city count."""
+    rows = read_geonames(source) if source.endswith(".txt") else read_cities_csv(source)
+    cities = []
+    for name, region, country, lat, lon, pop in rows:
+        key = normalize(name)
+        if key:
+            cities.append((key, -pop, name, region or "", country or "", lat, lon, pop))
+    cities.sort()  # by key, most populous first within a key
+
+    strings = bytearray()
+    records = bytearray()
+    for key, _, name, region, country, lat, lon, pop in cities:
+        k = key.encode("ascii")
+        label = _SEP.join((name, region, country)).encode("utf-8")[:0xFFFF]
+        records += _RECORD.pack(len(strings), len(k), len(label), lat, lon, min(pop, _NONE))
+        strings += k + label
+
+    top = {}  # prefix -> [(pop, id)] min-heap of the PREFIX_TOP most populous
+    for i, (key, _, _, _, _, _, _, pop) in enumerate(cities):
+        for n in range(1, min(depth, len(key)) + 1):
+            heap = top.setdefault(key[:n].encode("ascii"), [])
+            if len(heap) < PREFIX_TOP:
+                heapq.heappush(heap, (pop, -i))
+            else:
+                heapq.heappushpop(heap, (pop, -i))
+    row = _prefix_row(depth)
+    prefixes = bytearray()
+    for p in sorted(top):
+        ids = [-i for _, i in sorted(top[p], reverse=True)]
+        prefixes += row.pack(p, *(ids + [_NONE] * (PREFIX_TOP - len(ids))))
+
+    records_off = _HEADER_SIZE
+    prefix_off = records_off + len(records)
+    strings_off = prefix_off + len(prefixes)
+    header = _HEADER.pack(_MAGIC, _VERSION, depth, len(cities), len(top), records_off, prefix_off, strings_off)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(dest) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header.ljust(_HEADER_SIZE, b"\0"))
+            f.write(records)
+            f.write(prefixes)
+            f.write(strings)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, dest)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return len(cities)
+
+
+# ----- Lookup -----
+class Gazetteer:
+    """Memory-mapped city index; opened (and built from `source` if missing, outdated or in an
+    older format) on first use.
+
+    Thread-safe: the mapping is read-only once open.
+    """
+
+    def __init__(self, path=GAZETTEER_INDEX, source=GAZETTEER_SOURCE):
+        self.path = path
+        self.source = source
+        self._lock = threading.Lock()
+        self._map = None
+        self._fh = None
+        self._stats = {"suggest": 0, "lookups": 0, "hits": 0}
+
+    def _open(self):
+        if self._map is not None:
+            return self._map
+        with self._lock:
+            if self._map is None:
+                try:
+                    stale = os.path.getmtime(self.path) < os.path.getmtime(self.source)
+                except OSError:
+                    stale = not os.path.exists(self.path)
+                if stale:
+                    build_index(self.source, self.path)
+                opened = self._map_index()
+                if opened is None:
+                    # written by another version of this module (or truncated): rebuild it
+                    build_index(self.source, self.path)
+                    opened = self._map_index()
+                    if opened is None:
+                        raise ValueError(f"not a gazetteer index: {self.path}")
+                fh, m, (_, _, depth, n, n_prefix, rec_off, pre_off, str_off) = opened
+                self._n, self._n_prefix, self._depth = n, n_prefix, depth
+                self._rec_off, self._pre_off, self._str_off = rec_off, pre_off, str_off
+                self._prefix_row = _prefix_row(depth)
+                self._fh, self._map = fh, m
+        return self._map
+
+    def _map_index(self):
+        """(file, mapping, header) for the index at self.path, or None if it isn't one in this format."""
+        fh = open(self.path, "rb")
+        try:
+            m = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            fh.close()
+            return None
+        try:
+            header = _HEADER.unpack_from(m, 0)
+        except struct.error:
+            header = None
+        if header is None or header[0] != _MAGIC or header[1] != _VERSION:
+            m.close()
+            fh.close()
+            return None
+        return fh, m, header
+
+    def __len__(self):
+        self._open()
+        return self._n
+
+    def _key(self, i):
+        off, klen = struct.unpack_from("<IH", self._map, self._rec_off + i * _RECORD.size)
+        start = self._str_off + off
+        return self._map[start:start + klen]
+
+    def _place(self, i):
+        off, klen, llen, lat, lon, pop = _RECORD.unpack_from(self._map, self._rec_off + i * _RECORD.size)
+        start = self._str_off + off + klen
+        name, region, country = self._map[start:start + llen].decode("utf-8").split(_SEP)
+        return round(lat, 4), round(lon, 4), name, region, country
+
+    def _population(self, i):
+        return _RECORD.unpack_from(self._map, self._rec_off + i * _RECORD.size)[5]
+
+    def _bisect(self, key, lo=0):
+        # first record id whose key is >= key
+        hi = self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _range(self, key):
+        """Record ids [lo, hi) whose key starts with `key` (bytes)."""
+        lo = self._bisect(key)
+        return lo, self._bisect(key + b"\xff", lo)
+
+    def _table(self, key):
+        row = self._prefix_row
+        padded = key.ljust(self._depth, b"\0")
+        lo, hi = 0, self._n_prefix
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._map[self._pre_off + mid * row.size:self._pre_off + mid * row.size + self._depth] < padded:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._n_prefix:
+            p, *ids = row.unpack_from(self._map, self._pre_off + lo * row.size)
+            if p == padded:
+                return [i for i in ids if i != _NONE]
+        return []
+
+    def suggest(self, text, limit=SUGGEST_LIMIT):
+        """Most populous cities whose name starts with `text`, as (lat, lon, name, region, country) tuples."""
+        key = normalize(text).encode("ascii")
+        if not key:
+            return []
+        self._open()
+        with self._lock:
+            self._stats["suggest"] += 1
+        if len(key) <= self._depth and limit <= PREFIX_TOP:
+            ids = self._table(key)[:limit]
+        else:
+            lo, hi = self._range(key)
+            ids = heapq.nlargest(limit, range(lo, hi), key=self._population)
+        return [self._place(i) for i in ids]
+
+    def lookup(self, query):
+        """Exact match for a typed search ("Paris", "Portland, Maine", "London, GB"), most populous first; or None."""
+        parts = [p.strip() for p in str(query).split(",")]
+        key = normalize(parts[0]).encode("ascii")
+        qualifiers = [normalize(p) for p in parts[1:] if normalize(p)]
+        with self._lock:
+            self._stats["lookups"] += 1
+        if not key:
+            return None
+        self._open()
+        i = self._bisect(key)
+        while i < self._n and self._key(i) == key:  # most populous first
+            place = self._place(i)
+            fields = (normalize(place[3]), normalize(place[4]))
+            if all(q in fields for q in qualifiers):
+                with self._lock:
+                    self._stats["hits"] += 1
+                return place
+            i += 1
+        return None
+
+    def stats(self):
+        """Suggest calls, lookups, and lookups answered locally (each one a geocoding call saved)."""
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._fh.close()
+                self._map = self._fh = None
+
+
+gazetteer = Gazetteer()
+
+
+if __name__ == "__main__":
+    import sys
+    src = sys.argv[1] if len(sys.argv) > 1 else GAZETTEER_SOURCE
+    dst = sys.argv[2] if len(sys.argv) > 2 else GAZETTEER_INDEX
+    print(f"{build_index(src, dst)} cities -> {dst}")
@@ -0,0 +1,114 @@
+"""
+power.py
+Power-aware behaviour shared by the Kivy apps.
+
+Periodic refreshes are one-shot timers whose delay comes from the pipeline's
+RefreshScheduler (next predicted provider update, or error backoff).
+
+While the app is paused (mobile), minimized or hidden, PowerAwareMixin stops the
+periodic refresh, cancels running animations and drops the GPS subscription. On the
+way back it restarts them and, if the data went stale in the meantime, runs a single
+catch-up refresh. Losing window focus only pauses the animations.
+
+While animations are paused, start_animation() doesn't start new ones and sets their
+end values instead; running transitions are cut to their end values.
+
+The app provides `pipeline` (weather_core.RefreshPipeline), `anims`
+(animations.AnimationRegistry) and may override restart_animations().
+"""
+
+import time
+
+from kivy.clock import Clock, mainthread
+from kivy.core.window import Window
+
+from weather_core import location_service
+
+
+class PowerAwareMixin:
+    _refresh_event = None
+    _next_poll_at = 0
+    _suspended = False
+    _animations_paused = False
+
+    def start_polling(self, first_delay=0):
+        """Schedule the first refresh and hook window minimize/restore/focus events."""
+        self._schedule_poll(first_delay)
+        Window.bind(on_minimize=lambda *_: self.suspend(), on_hide=lambda *_: self.suspend(),
+                    on_restore=lambda *_: self.resume(), on_show=lambda *_: self.resume(),
+                    focus=self._on_window_focus)
+
+    def _poll(self, dt):
+        self.pipeline.poll(self._schedule_poll)
+
+    @mainthread
+    def _schedule_poll(self, delay):
+        if self._refresh_event is not None:
+            self._refresh_event.cancel()
+        self._refresh_event = None
+        self._next_poll_at = time.time() + delay
+        if not self._suspended:
+            self._refresh_event = Clock.schedule_once(self._poll, delay)
+
+    def schedule_stats(self):
+        """Refresh schedule decisions: counts, average delay, backoffs, skipped provider requests."""
+        return self.pipeline.scheduler.stats()
+
+    # mobile lifecycle
+    def on_pause(self):
+        self.suspend()
+        return True
+
+    def on_resume(self):
+        self.resume()
+
+    def suspend(self):
+        if self._suspended:
+            return
+        self._suspended = True
+        if self._refresh_event is not None:
+            self._refresh_event.cancel()
+        self.pause_animations()
+        location_service.unsubscribe()
+
+    def resume(self):
+        if not self._suspended:
+            return
+        self._suspended = False
+        location_service.subscribe()
+        self.resume_animations()
+        remaining = self._next_poll_at - time.time()
+        if remaining <= 0:
+            self._poll(0)  # data went stale while suspended: one catch-up refresh, which reschedules
+        else:
+            self._schedule_poll(remaining)
+
+    def pause_animations(self):
+        if self._animations_paused:
+            return
+        self._animations_paused = True
+        self.anims.cancel(finish=True)
+
+    def resume_animations(self):
+        if not self._animations_paused:
+            return
+        self._animations_paused = False
+        self.restart_animations()
+
+    def start_animation(self, target, anim, on_complete=None):
+        """anims.start(), or just the end values while animations are paused."""
+        if self._animations_paused:
+            self.anims.finish_values(target, anim)
+            return None
+        return self.anims.start(target, anim, on_complete)
+
+    def restart_animations(self):
+        """Restart long-running decorative animations after a pause (app hook)."""
+
+    def _on_window_focus(self, window, focused):
+        if self._suspended:
+            return
+        if focused:
+            self.resume_animations()
+        else:
+            self.pause_animations()
@@ -6,10 +6,13 @@ Centered SpaceX/Tesla-inspired weather + AQI app with:
  - Animated AQI color transitions
  - Animated dynamic gradient background (simulated blur via layered translucent rectangles)
  - Animated weather icons (emoji-based, subtle motion)
- - Bottom navigation bar (Weather / AQI / Forecast)
+ - Bottom navigation bar (Weather / AQI / Forecast / Watchlist)
+ - 5-day forecast: daily summary + lazily rendered 3-hourly cards (RecycleView)
+ - Watchlist of saved cities (virtualized RecycleView, batched rate-aware refresh)
 
 Requirements:
     pip install kivy plyer requests
+    pip install aiohttp   # optional: the asyncio engine (start_refresh) then needs no worker threads
 Replace OWM_API_KEY and IQAIR_API_KEY with your keys.
 """
 
@@ -24,19 +27,24 @@ from kivy.animation import Animation
 from kivy.core.window import Window
 from kivy.uix.screenmanager import ScreenManager, Screen
 
-import threading, requests, time
-
-# optional plyer gps
-try:
-    from plyer import gps
-    PLYER_GPS_AVAILABLE = True
-except Exception:
-    PLYER_GPS_AVAILABLE = False
+from animations import AnimationRegistry
+from citysearch import CitySearchMixin
+from power import PowerAwareMixin
+from timeseries import TimeSeriesStore
+from watchlist import Watchlist
+from weather_core import (
+    configure, shutdown_engine, location_service, RefreshPipeline, ReadingViewModel, format_reading,
+    load_snapshot, save_snapshot, keep_shown_weather,
+)
 
 # ----- CONFIG -----
 OWM_API_KEY = "YOUR_OPENWEATHERMAP_API_KEY"
 IQAIR_API_KEY = "YOUR_IQAIR_API_KEY"
 UPDATE_INTERVAL = 5 * 60  # seconds
+REFRESH_WORKERS = 2  # bounded pool for refresh / search pipelines
+WATCHLIST_TICK = 15  # seconds between watchlist batches while that screen is open
+
+configure(owm_api_key=OWM_API_KEY, iqair_api_key=IQAIR_API_KEY)
 
 Window.size = (1000, 700)  # desktop preview size (doesn't force mobile)
 
@@ -65,6 +73,129 @@ KV = f'''
     size_hint: None, None
     size: dp(64), dp(64)
 
+<DayRow@BoxLayout>:
+    day_text: ''
+    icon_text: ''
+    range_text: ''
+    mean_text: ''
+    precip_text: ''
+    spacing: dp(8)
+    padding: [dp(12), 0]
+    canvas.before:
+        Color:
+            rgba: (0.06,0.07,0.09,1)
+        RoundedRectangle:
+            pos: self.pos
+            size: self.size
+            radius: [10,]
+    Label:
+        text: root.day_text
+        font_size: '14sp'
+        color: (1,1,1,0.9)
+    Label:
+        text: root.icon_text
+        font_size: '20sp'
+        size_hint_x: .5
+    Label:
+        text: root.range_text
+        font_size: '14sp'
+        bold: True
+        color: (1,1,1,0.95)
+    Label:
+        text: root.mean_text
+        font_size: '12sp'
+        color: (1,1,1,0.6)
+    Label:
+        text: root.precip_text
+        font_size: '12sp'
+        color: (0.6,0.8,1,0.8)
+
+<HourCard@BoxLayout>:
+    time_text: ''
+    icon_text: ''
+    temp_text: ''
+    pop_text: ''
+    orientation: 'vertical'
+    padding: dp(4)
+    canvas.before:
+        Color:
+            rgba: (0.06,0.07,0.09,1)
+        RoundedRectangle:
+            pos: self.pos
+            size: self.size
+            radius: [10,]
+    Label:
+        text: root.time_text
+        font_size: '11sp'
+        color: (1,1,1,0.6)
+    Label:
+        text: root.icon_text
+        font_size: '20sp'
+    Label:
+        text: root.temp_text
+        font_size: '15sp'
+        bold: True
+        color: (1,1,1,0.95)
+    Label:
+        text: root.pop_text
+        font_size: '11sp'
+        color: (0.6,0.8,1,0.8)
+
+<WatchRow@BoxLayout>:
+    key: ''
+    name_text: ''
+    region_text: ''
+    temp_text: ''
+    aqi_text: ''
+    aqi_color: [1,1,1,1]
+    pm25_text: ''
+    spacing: dp(8)
+    padding: [dp(12), 0, dp(4), 0]
+    canvas.before:
+        Color:
+            rgba: (0.06,0.07,0.09,1)
+        RoundedRectangle:
+            pos: self.pos
+            size: self.size
+            radius: [10,]
+    BoxLayout:
+        orientation: 'vertical'
+        Label:
+            text: root.name_text
+            font_size: '14sp'
+            color: (1,1,1,0.95)
+            shorten: True
+            text_size: self.width, None
+        Label:
+            text: root.region_text
+            font_size: '11sp'
+            color: (1,1,1,0.55)
+            shorten: True
+            text_size: self.width, None
+    Label:
+        text: root.temp_text
+        font_size: '18sp'
+        bold: True
+        size_hint_x: .6
+    Label:
+        text: root.aqi_text
+        font_size: '18sp'
+        bold: True
+        color: root.aqi_color
+        size_hint_x: .5
+    Label:
+        text: root.pm25_text
+        font_size: '11sp'
+        color: (1,1,1,0.7)
+        size_hint_x: .8
+    Button:
+        text: 'x'
+        size_hint_x: None
+        width: dp(32)
+        background_normal: ''
+        background_color: (1,1,1,0.04)
+        on_release: app.unwatch(root.key)
+
 # root layout
 FloatLayout:
     id: rootfl
@@ -136,6 +267,7 @@ FloatLayout:
                     background_color: (1,1,1,0.04)
                     foreground_color: (1,1,1,0.95)
                     padding: [dp(8), dp(8), dp(8), dp(8)]
+                    on_text: app.on_city_text(self)
                     on_text_validate: app.search_city(self.text)
                 Button:
                     text: 'Search'
@@ -326,18 +458,80 @@ FloatLayout:
 
             Screen:
                 name: 'forecast'
+                on_enter: app.load_forecast()
                 BoxLayout:
                     orientation: 'vertical'
                     spacing: dp(12)
                     Label:
-                        text: 'Forecast (coming soon)'
-                        font_size: '16sp'
-                        color: (1,1,1,0.85)
-                    Label:
-                        text: 'You can add hourly and 7-day cards here.'
+                        text: app.forecast_status
+                        size_hint_y: None
+                        height: dp(24)
                         font_size: '12sp'
                         color: (1,1,1,0.6)
 
+                    # daily summary
+                    RecycleView:
+                        viewclass: 'DayRow'
+                        data: app.forecast_days
+                        RecycleBoxLayout:
+                            orientation: 'vertical'
+                            default_size: None, dp(44)
+                            default_size_hint: 1, None
+                            size_hint_y: None
+                            height: self.minimum_height
+                            spacing: dp(6)
+
+                    # 3-hourly cards; RecycleView only builds the ones scrolled into view
+                    RecycleView:
+                        viewclass: 'HourCard'
+                        data: app.forecast_hours
+                        size_hint_y: None
+                        height: dp(110)
+                        do_scroll_x: True
+                        do_scroll_y: False
+                        RecycleBoxLayout:
+                            orientation: 'horizontal'
+                            default_size: dp(76), dp(104)
+                            default_size_hint: None, None
+                            size_hint_x: None
+                            width: self.minimum_width
+                            spacing: dp(6)
+
+            Screen:
+                name: 'watchlist'
+                on_enter: app.start_watchlist()
+                on_leave: app.stop_watchlist()
+                BoxLayout:
+                    orientation: 'vertical'
+                    spacing: dp(8)
+                    BoxLayout:
+                        size_hint_y: None
+                        height: dp(36)
+                        spacing: dp(8)
+                        Label:
+                            text: app.watch_status
+                            font_size: '12sp'
+                            color: (1,1,1,0.6)
+                        Button:
+                            text: '+ Watch this place'
+                            size_hint_x: .6
+                            on_release: app.watch_current()
+                            background_normal: ''
+                            background_color: (1,1,1,0.04)
+                            color: (1,1,1,0.95)
+
+                    # virtualized: only rows in view exist, and a changed row refreshes only itself
+                    RecycleView:
+                        viewclass: 'WatchRow'
+                        data: app.watch_rows
+                        RecycleBoxLayout:
+                            orientation: 'vertical'
+                            default_size: None, dp(52)
+                            default_size_hint: 1, None
+                            size_hint_y: None
+                            height: self.minimum_height
+                            spacing: dp(4)
+
         # bottom navigation bar
         BoxLayout:
             size_hint_y: None
@@ -371,91 +565,17 @@ FloatLayout:
                 background_normal: ''
                 background_color: (1,1,1,0.03)
                 color: (1,1,1,0.95)
+            Button:
+                text: 'Watchlist'
+                on_release:
+                    sm.current = 'watchlist'
+                background_normal: ''
+                background_color: (1,1,1,0.03)
+                color: (1,1,1,0.95)
 '''
 
-# ---------- Helper functions (same as before) ----------
-def fetch_ip_location():
-    try:
-        r = requests.get("https://ipinfo.io/json", timeout=6)
-        if r.status_code == 200:
-            j = r.json()
-            loc = j.get("loc", "")
-            if loc:
-                lat_str, lon_str = loc.split(',')
-                city = j.get("city", "")
-                region = j.get("region", "")
-                country = j.get("country", "")
-                return float(lat_str), float(lon_str), city, region, country
-    except Exception:
-        pass
-    return None
-
-def owm_geocode_city(city_name, api_key):
-    try:
-        q = requests.utils.quote(city_name)
-        url = f"http://api.openweathermap.org/geo/1.0/direct?q={q}&limit=1&appid={api_key}"
-        r = requests.get(url, timeout=8)
-        r.raise_for_status()
-        j = r.json()
-        if isinstance(j, list) and j:
-            entry = j[0]
-            return float(entry.get("lat")), float(entry.get("lon")), entry.get("name",""), entry.get("state",""), entry.get("country","")
-    except Exception:
-        pass
-    return None
-
-def fetch_weather(lat, lon, api_key):
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-    r = requests.get(url, timeout=8)
-    r.raise_for_status()
-    return r.json()
-
-def fetch_openweather_pollution(lat, lon, api_key):
-    try:
-        url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={api_key}"
-        r = requests.get(url, timeout=8)
-        r.raise_for_status()
-        j = r.json()
-        if "list" in j and j["list"]:
-            return j["list"][0].get("components", {})
-    except Exception:
-        pass
-    return None
-
-def fetch_aqi_iqair(lat, lon, key):
-    try:
-        url = f"https://api.airvisual.com/v2/nearest_city?lat={lat}&lon={lon}&key={key}"
-        r = requests.get(url, timeout=8)
-        r.raise_for_status()
-        j = r.json()
-        if j.get("status") == "success":
-            pollution = j.get("data", {}).get("current", {}).get("pollution", {})
-            aqi_val = pollution.get("aqius")
-            main = pollution.get("mainus") or pollution.get("maincn") or ""
-            return (int(aqi_val) if aqi_val is not None else None, main)
-    except Exception:
-        pass
-    return (None, "")
-
-def aqi_category_and_color(aqi_value):
-    try:
-        aqi = int(aqi_value)
-    except Exception:
-        return "Unknown", "No data", [1,1,1,1]
-    if aqi <= 50:
-        return "Good", "Air quality is satisfactory.", [0.2, 0.8, 0.2, 1]
-    if aqi <= 100:
-        return "Moderate", "Acceptable; sensitive groups should be cautious.", [0.95, 0.8, 0.2, 1]
-    if aqi <= 150:
-        return "Unhealthy for SG", "Sensitive groups may experience health effects.", [0.9, 0.55, 0.12, 1]
-    if aqi <= 200:
-        return "Unhealthy", "Everyone may begin to experience health effects.", [0.9, 0.2, 0.2, 1]
-    if aqi <= 300:
-        return "Very Unhealthy", "Health alert: emergency conditions possible.", [0.6, 0.15, 0.45, 1]
-    return "Hazardous", "Health warnings of emergency conditions.", [0.5, 0.02, 0.02, 1]
-
 # ---------- App ----------
-class SpaceWeatherApp(App):
+class SpaceWeatherApp(CitySearchMixin, PowerAwareMixin, App):
     # UI properties
     temp_display = StringProperty("--°C")
     condition_display = StringProperty("Loading…")
@@ -472,6 +592,11 @@ class SpaceWeatherApp(App):
     wind_display = StringProperty("-- m/s")
     pressure_display = StringProperty("-- hPa")
     weather_icon = StringProperty("☀️")  # emoji icon
+    forecast_status = StringProperty("")
+    forecast_days = ListProperty([])
+    forecast_hours = ListProperty([])
+    watch_rows = ListProperty([])
+    watch_status = StringProperty("")
 
     # animated background color properties (two color stops)
     bg_a = ListProperty([0.02, 0.03, 0.04, 1])
@@ -479,19 +604,41 @@ class SpaceWeatherApp(App):
 
     # internal
     _last_fetch = None
+    _shown = {}  # reading on screen: last full reading + partials of the run in progress
+    _watch_event = None
     _last_aqi_color = ListProperty([1,1,1,1])
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._view = ReadingViewModel()
+        self.anims = AnimationRegistry()
+        self.history = TimeSeriesStore()
+        self.watchlist = Watchlist()
+        self.pipeline = RefreshPipeline(self._publish, workers=REFRESH_WORKERS, locate=self.determine_location,
+                                        baseline_interval=UPDATE_INTERVAL, publish_partial=self._apply_partial,
+                                        history=self.history)
+
     def build(self):
         self.title = "SpaceWeather (Enhanced UI)"
+        # last saved reading first, so the first frame shows data instead of "Loading…"
+        self._restore_snapshot()
         return Builder.load_string(KV)
 
+    def _restore_snapshot(self):
+        snap = load_snapshot()
+        if not snap:
+            return
+        self._last_fetch = self._shown = snap
+        for name, value in self._view.diff(format_reading(snap)).items():
+            setattr(self, name, value)
+
     def on_start(self):
+        # long-lived GPS subscription; refreshes read the latest fix without blocking
+        location_service.subscribe()
         # background gradient animation loop
         Clock.schedule_once(lambda dt: self._start_bg_animation(), 0.3)
-        # initial fetch
-        Clock.schedule_once(lambda dt: threading.Thread(target=self.update_all, daemon=True).start(), 0.5)
-        # periodic updates
-        Clock.schedule_interval(lambda dt: threading.Thread(target=self.update_all, daemon=True).start(), UPDATE_INTERVAL)
+        # initial fetch, then adaptive periodic updates (suspended while paused / minimized)
+        self.start_polling(first_delay=0.5)
 
     # ---------------- Background gradient animation ----------------
     def _start_bg_animation(self):
@@ -506,10 +653,14 @@ class SpaceWeatherApp(App):
         def cycle(i=0):
             a, b = palettes[i % len(palettes)]
             anim = Animation(bg_a=a, bg_b=b, d=8.5, t='out_quad')
-            anim.bind(on_complete=lambda *_: cycle(i+1))
-            anim.start(self)
+            # registry cancels a previous cycle if this is ever restarted
+            self.start_animation(self, anim, on_complete=lambda *_: cycle(i+1))
         cycle(0)
 
+    def restart_animations(self):
+        self._start_bg_animation()
+        self._animate_weather_icon(self.weather_icon)
+
     # ---------------- AQI color animation ----------------
     @mainthread
     def _animate_aqi_color(self, target_color):
@@ -517,7 +668,7 @@ class SpaceWeatherApp(App):
         try:
             # use Animation on the aqi_color property (must be list)
             anim = Animation(aqi_color=target_color, d=0.9, t='out_cubic')
-            anim.start(self)
+            self.start_animation(self, anim)
         except Exception:
             self.aqi_color = target_color
 
@@ -528,10 +679,10 @@ class SpaceWeatherApp(App):
         self.weather_icon = icon_text
         try:
             lbl = self.root.ids.weather_icon
-            # cancel previous animations by starting a new one
+            # one bounce loop per label: an identical loop keeps running instead of stacking
             anim = Animation(font_size=dp(46), d=0.6) + Animation(font_size=dp(40), d=0.6)
             anim.repeat = True
-            anim.start(lbl)
+            self.start_animation(lbl, anim)
         except Exception:
             pass
 
@@ -539,214 +690,147 @@ class SpaceWeatherApp(App):
     def search_city(self, city_text):
         if not city_text or not city_text.strip():
             return
-        threading.Thread(target=self._search_and_fetch, args=(city_text.strip(),), daemon=True).start()
+        self.dismiss_suggestions()
+        self.pipeline.search(city_text.strip())
 
-    def _search_and_fetch(self, city_text):
-        res = owm_geocode_city(city_text, OWM_API_KEY)
-        if not res:
-            self._update_ui_from_data({"condition": "City not found"})
-            return
-        lat, lon, name, state, country = res
-        self.update_all(lat_override=lat, lon_override=lon, city=name, region=state or country)
-
-    def determine_location(self):
-        if PLYER_GPS_AVAILABLE:
-            try:
-                location_event = {"lat": None, "lon": None}
-                def on_location(**kwargs):
-                    try:
-                        location_event["lat"] = float(kwargs.get("lat"))
-                        location_event["lon"] = float(kwargs.get("lon"))
-                    except Exception:
-                        pass
-                def on_status(status):
-                    pass
-                gps.configure(on_location=on_location, on_status=on_status)
-                gps.start(minTime=1000, minDistance=0)
-                timeout = time.time() + 6
-                while time.time() < timeout:
-                    if location_event["lat"] and location_event["lon"]:
-                        gps.stop()
-                        return location_event["lat"], location_event["lon"], None, None, None
-                    time.sleep(0.6)
-                gps.stop()
-            except Exception:
-                pass
-        return fetch_ip_location()
+    def determine_location(self, timeout=None):
+        return location_service.locate(timeout)
 
     # ---------------- UI update (mainthread) ----------------
     @mainthread
     def _update_ui_from_data(self, wdata):
+        wdata = keep_shown_weather(self._shown, wdata)
+        if wdata and "temp" in wdata:
+            self._shown = wdata
+        self._render(wdata)
+
+    @mainthread
+    def _apply_partial(self, fields):
+        """Merge one provider's fields into what is on screen; only the changed labels update."""
+        same_place = (self._shown.get("lat"), self._shown.get("lon")) == (fields.get("lat"), fields.get("lon"))
+        self._shown = dict(self._shown if same_place else {}, **fields)
+        self._render(self._shown)
+
+    def _render(self, wdata):
         if not wdata:
-            self.condition_display = "Unable to fetch data"
+            changes = self._view.diff({"condition_display": "Unable to fetch data"})
+        else:
+            changes = self._view.diff(format_reading(wdata))
+
+        # animated properties first; everything else is a plain assignment
+        if "aqi_color" in changes:
+            self._animate_aqi_color(changes.pop("aqi_color"))
+        if "weather_icon" in changes:
+            self._animate_weather_icon(changes.pop("weather_icon"))
+        for name, value in changes.items():
+            setattr(self, name, value)
+
+    # ---------------- Forecast ----------------
+    def load_forecast(self):
+        """Fetch, aggregate and format the forecast off the UI thread (cached until the next issue)."""
+        data = self._last_fetch or {}
+        lat, lon = data.get("lat"), data.get("lon")
+        if lat is None or lon is None:
+            self.forecast_status = "Waiting for location…"
             return
+        if not self.forecast_days:
+            self.forecast_status = "Loading forecast…"
+        self.pipeline.request_forecast(lat, lon).add_done_callback(self._forecast_loaded)
 
-        # temp
-        temp = wdata.get('temp')
-        if temp is None:
-            new_temp_text = "--°C"
-        else:
-            try:
-                new_temp_text = f"{float(temp):.0f}°C"
-            except Exception:
-                new_temp_text = f"{temp}°C"
-
-        # update temp label without extra animation (we already have temp animation earlier)
-        self.temp_display = new_temp_text
-
-        # condition and location
-        self.condition_display = wdata.get("condition", "—")
-        city = wdata.get('city','')
-        region = wdata.get('region','')
-        self.location_display = f"{city} {region}".strip()
-        self.updated_display = f"Updated {time.strftime('%H:%M:%S')}"
-
-        # AQI and animate color
-        aqi_val = wdata.get("aqi")
-        if aqi_val is not None:
-            self.aqi_display = str(aqi_val)
-            cat, msg, target_color = aqi_category_and_color(aqi_val)
-            self.aqi_category = cat
-            self.aqi_message = msg
-            # animate color transition
-            self._animate_aqi_color(target_color)
-        else:
-            self.aqi_display = "--"
-            self.aqi_category = "No AQI"
-            self.aqi_message = "Data unavailable"
-            self._animate_aqi_color([1,1,1,1])
-
-        # pollutants
-        pm25 = wdata.get("pm2_5")
-        pm10 = wdata.get("pm10")
-        self.pm25_display = (f"{float(pm25):.1f} µg/m³" if pm25 is not None else "-- µg/m³")
-        self.pm10_display = (f"{float(pm10):.1f} µg/m³" if pm10 is not None else "-- µg/m³")
-        self.main_pollutant = wdata.get("main_pollutant") or "--"
-
-        # details
-        humidity = wdata.get('humidity')
+    @mainthread
+    def _forecast_loaded(self, fut):
         try:
-            if humidity is None or humidity == "--":
-                self.humidity_display = "--%"
-            else:
-                h = int(float(humidity))
-                if h < 0: h = 0
-                if h > 100: h = min(h, 100)
-                self.humidity_display = f"{h}%"
+            days, hours = fut.result()
         except Exception:
-            self.humidity_display = f"{humidity}%"
+            if not fut.cancelled():
+                self.forecast_status = "Forecast unavailable"
+            return
+        self.forecast_status = f"5-day forecast · {self.location_display}"
+        if days != self.forecast_days:
+            self.forecast_days = days
+        if hours != self.forecast_hours:
+            self.forecast_hours = hours
+
+    # ---------------- Watchlist ----------------
+    def start_watchlist(self):
+        self.watch_rows = self.watchlist.rows()
+        self.watch_status = f"{len(self.watchlist)} cities"
+        if self._watch_event is None:
+            self._watch_event = Clock.schedule_interval(self._watch_tick, WATCHLIST_TICK)
+        self._watch_tick(0)
+
+    def stop_watchlist(self):
+        if self._watch_event is not None:
+            self._watch_event.cancel()
+            self._watch_event = None
+
+    def _watch_tick(self, dt):
+        if self._suspended or not len(self.watchlist):
+            return
+        # a batch still queued is replaced, so slow links don't pile batches up
+        fut = self.pipeline.pool.submit(self.watchlist.refresh_batch, replace_key="watchlist")
+        fut.add_done_callback(self._watch_rows_changed)
 
-        wind = wdata.get('wind')
+    @mainthread
+    def _watch_rows_changed(self, fut):
         try:
-            if wind is None or wind == "--":
-                self.wind_display = "-- m/s"
-            else:
-                self.wind_display = f"{float(wind):.1f} m/s"
+            changed = fut.result()
         except Exception:
-            self.wind_display = str(wind)
+            return
+        index = {row["key"]: i for i, row in enumerate(self.watch_rows)}
+        for row in changed:
+            i = index.get(row["key"])
+            if i is not None:
+                # item assignment: RecycleView refreshes this index only, and only if it is visible
+                self.watch_rows[i] = row
+
+    def watch_current(self):
+        data = self._last_fetch or {}
+        if data.get("lat") is None or data.get("lon") is None:
+            return
+        if self.watchlist.add(data.get("city") or "Here", data.get("region", ""), data["lat"], data["lon"]):
+            self.start_watchlist()
 
-        pressure = wdata.get('pressure')
-        try:
-            if pressure is None or pressure == "--":
-                self.pressure_display = "-- hPa"
-            else:
-                self.pressure_display = f"{int(float(pressure))} hPa"
-        except Exception:
-            self.pressure_display = str(pressure)
-
-        # choose and animate weather icon (emoji) based on condition & AQI
-        cond = (self.condition_display or "").lower()
-        icon = "☀️"
-        if "cloud" in cond:
-            icon = "☁️"
-        elif "rain" in cond or "drizzle" in cond:
-            icon = "🌧️"
-        elif "snow" in cond:
-            icon = "❄️"
-        elif "storm" in cond or "thunder" in cond:
-            icon = "⛈️"
-        elif "mist" in cond or "fog" in cond or "haze" in cond:
-            icon = "🌫️"
-
-        # if AQI is bad, overlay a small warning icon
-        try:
-            aqi_val_int = int(aqi_val) if aqi_val is not None else None
-        except Exception:
-            aqi_val_int = None
+    def unwatch(self, key):
+        self.watchlist.remove(key)
+        self.watch_rows = [row for row in self.watch_rows if row["key"] != key]
+        self.watch_status = f"{len(self.watchlist)} cities"
 
-        if aqi_val_int is not None and aqi_val_int > 150:
-            # unhealthy: add small mask (smoke emoji) to icon string
-            icon = icon + "💨"
-        self._animate_weather_icon(icon)
+    def animation_stats(self):
+        """Live / started / reused / cancelled animation counts."""
+        return self.anims.stats()
+
+    def view_stats(self):
+        """How many property updates were applied vs skipped as unchanged."""
+        return self._view.stats()
 
     # ---------------- Main background pipeline ----------------
     def update_all(self, lat_override=None, lon_override=None, city=None, region=None):
-        try:
-            if lat_override is None or lon_override is None:
-                loc = self.determine_location()
-                if not loc:
-                    self._update_ui_from_data(None)
-                    return
-                lat, lon, city_auto, region_auto, country_auto = loc
-                if city is None:
-                    city = city_auto or ""
-                if region is None:
-                    region = region_auto or country_auto or ""
-            else:
-                lat, lon = lat_override, lon_override
-
-            # weather
-            try:
-                wjson = fetch_weather(lat, lon, OWM_API_KEY)
-                temp = wjson["main"]["temp"]
-                cond = wjson["weather"][0]["description"].title()
-                humidity = wjson["main"].get("humidity")
-                wind = wjson.get("wind", {}).get("speed")
-                pressure = wjson["main"].get("pressure")
-            except Exception:
-                temp = None
-                cond = "Weather error"
-                humidity = None
-                wind = None
-                pressure = None
-
-            # IQAir AQI
-            aqi_val, main_poll = (None, "")
-            try:
-                aqi_val, main_poll = fetch_aqi_iqair(lat, lon, IQAIR_API_KEY)
-            except Exception:
-                aqi_val, main_poll = (None, "")
-
-            # OpenWeather pollutant breakdown
-            pm2_5 = None
-            pm10 = None
-            try:
-                comps = fetch_openweather_pollution(lat, lon, OWM_API_KEY)
-                if comps:
-                    pm2_5 = comps.get("pm2_5")
-                    pm10 = comps.get("pm10")
-            except Exception:
-                pm2_5 = None
-                pm10 = None
-
-            data = {
-                "temp": temp,
-                "condition": cond,
-                "city": city or "",
-                "region": region or "",
-                "country": "",
-                "aqi": aqi_val,
-                "main_pollutant": main_poll or "--",
-                "pm2_5": pm2_5,
-                "pm10": pm10,
-                "humidity": humidity if humidity is not None else "--",
-                "wind": wind if wind is not None else "--",
-                "pressure": pressure if pressure is not None else "--",
-            }
+        return self.pipeline.update_all(lat_override, lon_override, city, region)
+
+    async def update_all_async(self, lat_override=None, lon_override=None, city=None, region=None):
+        """Coroutine twin of update_all for the asyncio engine; can be awaited, cancelled or time-boxed."""
+        return await self.pipeline.update_all_async(lat_override, lon_override, city, region)
+
+    def start_refresh(self, timeout=None, **overrides):
+        return self.pipeline.start_refresh(timeout=timeout, **overrides)
+
+    def pool_stats(self):
+        """Queue depth / wait-time metrics of the refresh pool, for sizing REFRESH_WORKERS."""
+        return self.pipeline.pool.stats()
+
+    def _publish(self, data):
+        # only readings with weather replace _last_fetch and the snapshot; failed refreshes and status messages don't
+        if data and data.get("temp") is not None:
             self._last_fetch = data
-            self._update_ui_from_data(data)
-        except Exception as e:
-            self._update_ui_from_data({"condition": f"Error: {e}"})
+            save_snapshot(data)
+        self._update_ui_from_data(data)
+
+    def on_stop(self):
+        self.anims.cancel()
+        location_service.unsubscribe()
+        shutdown_engine()
+        self.history.close()
 
 if __name__ == '__main__':
     SpaceWeatherApp().run()
@@ -1,23 +1,27 @@
 from kivy.app import App
 from kivy.lang import Builder
 from kivy.properties import StringProperty, ListProperty, NumericProperty
-from kivy.clock import Clock, mainthread
+from kivy.clock import mainthread
 from kivy.core.window import Window
 from kivy.metrics import dp
 from kivy.animation import Animation
 
-import threading, requests, time
-
-try:
-    from plyer import gps
-    PLYER_GPS_AVAILABLE = True
-except Exception:
-    PLYER_GPS_AVAILABLE = False
+from animations import AnimationRegistry
+from citysearch import CitySearchMixin
+from power import PowerAwareMixin
+from timeseries import TimeSeriesStore
+from weather_core import (
+    configure, shutdown_engine, location_service, RefreshPipeline, ReadingViewModel, format_reading,
+    load_snapshot, save_snapshot, keep_shown_weather, PRIORITY_USER,
+)
 
 # ----- CONFIG -----
 OWM_API_KEY  = ""
 IQAIR_API_KEY = ""    
 UPDATE_INTERVAL = 5 * 60 
+REFRESH_WORKERS = 2
+
+configure(owm_api_key=OWM_API_KEY, iqair_api_key=IQAIR_API_KEY)
 
 Window.size = (900, 700)
 
@@ -81,6 +85,7 @@ FloatLayout:
                     background_color: (1,1,1,0.04)
                     foreground_color: (1,1,1,0.95)
                     padding: [dp(8), dp(8), dp(8), dp(8)]
+                    on_text: app.on_city_text(self)
                     on_text_validate: app.search_city(self.text)
                 Button:
                     text: 'Search'
@@ -286,93 +291,15 @@ FloatLayout:
             height: dp(10)
 '''
 
-def fetch_ip_location():
-    try:
-        r = requests.get("https://ipinfo.io/json", timeout=6)
-        if r.status_code == 200:
-            j = r.json()
-            loc = j.get("loc", "")
-            if loc:
-                lat_str, lon_str = loc.split(',')
-                city = j.get("city", "")
-                region = j.get("region", "")
-                country = j.get("country", "")
-                return float(lat_str), float(lon_str), city, region, country
-    except Exception:
-        pass
-    return None
-
-def owm_geocode_city(city_name, api_key):
-  
-    try:
-        q = requests.utils.quote(city_name)
-        url = f"http://api.openweathermap.org/geo/1.0/direct?q={q}&limit=1&appid={api_key}"
-        r = requests.get(url, timeout=8)
-        r.raise_for_status()
-        j = r.json()
-        if isinstance(j, list) and j:
-            entry = j[0]
-            return float(entry.get("lat")), float(entry.get("lon")), entry.get("name",""), entry.get("state",""), entry.get("country","")
-    except Exception:
-        pass
-    return None
-
-def fetch_weather(lat, lon, api_key):
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-    r = requests.get(url, timeout=8)
-    r.raise_for_status()
-    return r.json()
-
-def fetch_openweather_pollution(lat, lon, api_key):
-  
-    try:
-        url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={api_key}"
-        r = requests.get(url, timeout=8)
-        r.raise_for_status()
-        j = r.json()
-        
-        if "list" in j and j["list"]:
-            comps = j["list"][0].get("components", {})
-            return comps 
-    except Exception:
-        pass
-    return None
-
-def fetch_aqi_iqair(lat, lon, key):
-    """IQAir nearest_city for aqius and main pollutant if present."""
-    try:
-        url = f"https://api.airvisual.com/v2/nearest_city?lat={lat}&lon={lon}&key={key}"
-        r = requests.get(url, timeout=8)
-        r.raise_for_status()
-        j = r.json()
-        if j.get("status") == "success":
-            pollution = j.get("data", {}).get("current", {}).get("pollution", {})
-            aqi_val = pollution.get("aqius")
-            main = pollution.get("mainus") or pollution.get("maincn") or ""
-            return (int(aqi_val) if aqi_val is not None else None, main)
-    except Exception:
-        pass
-    return (None, "")
-
-def aqi_category_and_color(aqi_value):
-    try:
-        aqi = int(aqi_value)
-    except Exception:
-        return "Unknown", "No data", [1,1,1,1]
-    if aqi <= 50:
-        return "Good", "Air quality is satisfactory.", [0.2, 0.8, 0.2, 1]
-    if aqi <= 100:
-        return "Moderate", "Acceptable; sensitive groups should be cautious.", [0.95, 0.8, 0.2, 1]
-    if aqi <= 150:
-        return "Unhealthy for SG", "Sensitive groups may experience health effects.", [0.9, 0.55, 0.12, 1]
-    if aqi <= 200:
-        return "Unhealthy", "Everyone may begin to experience health effects.", [0.9, 0.2, 0.2, 1]
-    if aqi <= 300:
-        return "Very Unhealthy", "Health alert: emergency conditions possible.", [0.6, 0.15, 0.45, 1]
-    return "Hazardous", "Health warnings of emergency conditions.", [0.5, 0.02, 0.02, 1]
-
 # ----- App -----
-class SpaceWeatherApp(App):
+# display properties this layout has (no animated weather icon here)
+VIEW_FIELDS = (
+    "temp_display", "condition_display", "location_display", "updated_display", "aqi_display",
+    "aqi_category", "aqi_message", "aqi_color", "pm25_display", "pm10_display", "main_pollutant",
+    "humidity_display", "wind_display", "pressure_display",
+)
+
+class SpaceWeatherApp(CitySearchMixin, PowerAwareMixin, App):
     temp_display = StringProperty("--°C")
     condition_display = StringProperty("Loading…")
     location_display = StringProperty("Locating…")
@@ -391,61 +318,47 @@ class SpaceWeatherApp(App):
   
     _last_fetch = None
     _last_temp_value = None
+    _shown = {}  # reading on screen: last full reading + partials of the run in progress
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._view = ReadingViewModel(fields=VIEW_FIELDS)
+        self.anims = AnimationRegistry()
+        self.history = TimeSeriesStore()
+        self.pipeline = RefreshPipeline(self._publish, workers=REFRESH_WORKERS, locate=self.determine_location,
+                                        baseline_interval=UPDATE_INTERVAL, publish_partial=self._apply_partial,
+                                        history=self.history)
 
     def build(self):
         self.title = "SpaceWeather (Centered + AQ)"
+        # last saved reading first, so the first frame shows data instead of "Loading…"
+        self._restore_snapshot()
         return Builder.load_string(KV)
 
+    def _restore_snapshot(self):
+        snap = load_snapshot()
+        if not snap:
+            return
+        self._last_fetch = self._shown = snap
+        for name, value in self._view.diff(format_reading(snap)).items():
+            setattr(self, name, value)
+
     def on_start(self):
-        
-        Clock.schedule_once(lambda dt: threading.Thread(target=self.update_all, daemon=True).start())
-      
-        Clock.schedule_interval(lambda dt: threading.Thread(target=self.update_all, daemon=True).start(), UPDATE_INTERVAL)
+        location_service.subscribe()
+        self.start_polling(first_delay=0)
 
     def manual_refresh(self):
-        threading.Thread(target=self.update_all, daemon=True).start()
+        self.pipeline.request_refresh(priority=PRIORITY_USER)
 
     def search_city(self, city_text):
         
         if not city_text or not city_text.strip():
             return
-        threading.Thread(target=self._search_and_fetch, args=(city_text.strip(),), daemon=True).start()
+        self.dismiss_suggestions()
+        self.pipeline.search(city_text.strip())
 
-    def _search_and_fetch(self, city_text):
-        res = owm_geocode_city(city_text, OWM_API_KEY)
-        if not res:
-          
-            self._update_ui_from_data({"condition": "City not found"})
-            return
-        lat, lon, name, state, country = res
-      
-        self.update_all(lat_override=lat, lon_override=lon, city=name, region=state or country)
-
-    def determine_location(self):
-        
-        if PLYER_GPS_AVAILABLE:
-            try:
-                location_event = {"lat": None, "lon": None}
-                def on_location(**kwargs):
-                    try:
-                        location_event["lat"] = float(kwargs.get("lat"))
-                        location_event["lon"] = float(kwargs.get("lon"))
-                    except Exception:
-                        pass
-                def on_status(status):
-                    pass
-                gps.configure(on_location=on_location, on_status=on_status)
-                gps.start(minTime=1000, minDistance=0)
-                timeout = time.time() + 6
-                while time.time() < timeout:
-                    if location_event["lat"] and location_event["lon"]:
-                        gps.stop()
-                        return location_event["lat"], location_event["lon"], None, None, None
-                    time.sleep(0.6)
-                gps.stop()
-            except Exception:
-                pass
-        return fetch_ip_location()
+    def determine_location(self, timeout=None):
+        return location_service.locate(timeout)
 
     from kivy.metrics import dp
     @mainthread
@@ -458,7 +371,7 @@ class SpaceWeatherApp(App):
             label_widget.text = new_text
            
             anim = Animation(opacity=1.0, font_size=dp(64), d=0.45, t='out_cubic')
-            anim.start(label_widget)
+            self.start_animation(label_widget, anim)
         except Exception:
             
             label_widget.text = new_text
@@ -468,176 +381,73 @@ class SpaceWeatherApp(App):
 
     @mainthread
     def _update_ui_from_data(self, wdata):
-        """Update UI on main thread"""
-        if not wdata:
-            self.condition_display = "Unable to fetch data"
-            return
+        """Update UI on main thread, touching only properties whose text actually changed"""
+        wdata = keep_shown_weather(self._shown, wdata)
+        if wdata and "temp" in wdata:
+            self._shown = wdata
+        self._render(wdata)
 
-       
-        temp = wdata.get('temp')
-        if temp is None:
-            new_temp_text = "--°C"
+    @mainthread
+    def _apply_partial(self, fields):
+        """Merge one provider's fields into what is on screen as soon as they arrive."""
+        same_place = (self._shown.get("lat"), self._shown.get("lon")) == (fields.get("lat"), fields.get("lon"))
+        self._shown = dict(self._shown if same_place else {}, **fields)
+        self._render(self._shown)
+
+    def _render(self, wdata):
+        if not wdata:
+            changes = self._view.diff({"condition_display": "Unable to fetch data"})
         else:
-            try:
-                new_temp_text = f"{float(temp):.0f}°C"
-            except Exception:
-                new_temp_text = f"{temp}°C"
+            changes = self._view.diff(format_reading(wdata))
 
-       
-        if new_temp_text != self.temp_display:
-           
+        if "temp_display" in changes:
+            new_temp_text = changes.pop("temp_display")
             try:
                 temp_label = self.root.ids.temp_label
                 self._animate_temp_change(temp_label, new_temp_text)
             except Exception:
                 self.temp_display = new_temp_text
-        else:
-            self.temp_display = new_temp_text
-
-        self.condition_display = wdata.get("condition", "—")
-        city = wdata.get('city','')
-        region = wdata.get('region','')
-        self.location_display = f"{city} {region}".strip()
-        self.updated_display = f"Updated {time.strftime('%H:%M:%S')}"
-     
-        aqi_val = wdata.get("aqi")
-        if aqi_val is not None:
-            self.aqi_display = str(aqi_val)
-            cat, msg, color = aqi_category_and_color(aqi_val)
-            self.aqi_category = cat
-            self.aqi_message = msg
-            self.aqi_color = color
-        else:
-            self.aqi_display = "--"
-            self.aqi_category = "No AQI"
-            self.aqi_message = "Data unavailable"
-            self.aqi_color = [1,1,1,1]
+        for name, value in changes.items():
+            setattr(self, name, value)
 
-        
-        pm25 = wdata.get("pm2_5")
-        pm10 = wdata.get("pm10")
-        if pm25 is None:
-            self.pm25_display = "-- µg/m³"
-        else:
-            try:
-                self.pm25_display = f"{float(pm25):.1f} µg/m³"
-            except Exception:
-                self.pm25_display = str(pm25)
-
-        if pm10 is None:
-            self.pm10_display = "-- µg/m³"
-        else:
-            try:
-                self.pm10_display = f"{float(pm10):.1f} µg/m³"
-            except Exception:
-                self.pm10_display = str(pm10)
-
-        main_poll = wdata.get("main_pollutant") or "--"
-        self.main_pollutant = main_poll
-
-       
-        humidity = wdata.get('humidity')
-        try:
-            if humidity is None or humidity == "--":
-                self.humidity_display = "--%"
-            else:
-                h = int(float(humidity))
-                if h < 0: h = 0
-                if h > 100: h = min(h, 100)
-                self.humidity_display = f"{h}%"
-        except Exception:
-            self.humidity_display = f"{humidity}%"
-
-        wind = wdata.get('wind')
-        try:
-            if wind is None or wind == "--":
-                self.wind_display = "-- m/s"
-            else:
-                self.wind_display = f"{float(wind):.1f} m/s"
-        except Exception:
-            self.wind_display = str(wind)
+    def animation_stats(self):
+        """Live / started / reused / cancelled animation counts."""
+        return self.anims.stats()
 
-        pressure = wdata.get('pressure')
-        try:
-            if pressure is None or pressure == "--":
-                self.pressure_display = "-- hPa"
-            else:
-                self.pressure_display = f"{int(float(pressure))} hPa"
-        except Exception:
-            self.pressure_display = str(pressure)
+    def view_stats(self):
+        """How many property updates were applied vs skipped as unchanged."""
+        return self._view.stats()
 
     def update_all(self, lat_override=None, lon_override=None, city=None, region=None):
         """
         Main background pipeline. If lat_override/lon_override provided (via search),
         use them; otherwise auto-detect location.
         """
-        try:
-            if lat_override is None or lon_override is None:
-                loc = self.determine_location()
-                if not loc:
-                    self._update_ui_from_data(None)
-                    return
-                lat, lon, city_auto, region_auto, country_auto = loc
-              
-                if city is None:
-                    city = city_auto or ""
-                if region is None:
-                    region = region_auto or country_auto or ""
-            else:
-                lat, lon = lat_override, lon_override
-
-          
-            try:
-                wjson = fetch_weather(lat, lon, OWM_API_KEY)
-                temp = wjson["main"]["temp"]
-                cond = wjson["weather"][0]["description"].title()
-                humidity = wjson["main"].get("humidity")
-                wind = wjson.get("wind", {}).get("speed")
-                pressure = wjson["main"].get("pressure")
-            except Exception:
-                temp = None
-                cond = "Weather error"
-                humidity = None
-                wind = None
-                pressure = None
-
-         
-            aqi_val, main_poll = (None, "")
-            try:
-                aqi_val, main_poll = fetch_aqi_iqair(lat, lon, IQAIR_API_KEY)
-            except Exception:
-                aqi_val, main_poll = (None, "")
+        return self.pipeline.update_all(lat_override, lon_override, city, region)
 
-            
-            pm2_5 = None
-            pm10 = None
-            try:
-                comps = fetch_openweather_pollution(lat, lon, OWM_API_KEY)
-                if comps:
-                    pm2_5 = comps.get("pm2_5")
-                    pm10 = comps.get("pm10")
-            except Exception:
-                pm2_5 = None
-                pm10 = None
-
-            data = {
-                "temp": temp,
-                "condition": cond,
-                "city": city or "",
-                "region": region or "",
-                "country": "",
-                "aqi": aqi_val,
-                "main_pollutant": main_poll or "--",
-                "pm2_5": pm2_5,
-                "pm10": pm10,
-                "humidity": humidity if humidity is not None else "--",
-                "wind": wind if wind is not None else "--",
-                "pressure": pressure if pressure is not None else "--",
-            }
+    async def update_all_async(self, lat_override=None, lon_override=None, city=None, region=None):
+        """Coroutine twin of update_all for the asyncio engine; can be awaited, cancelled or time-boxed."""
+        return await self.pipeline.update_all_async(lat_override, lon_override, city, region)
+
+    def start_refresh(self, timeout=None, **overrides):
+        return self.pipeline.start_refresh(timeout=timeout, **overrides)
+
+    def pool_stats(self):
+        """Queue depth / wait-time metrics of the refresh pool, for sizing REFRESH_WORKERS."""
+        return self.pipeline.pool.stats()
+
+    def _publish(self, data):
+        # only readings with weather replace _last_fetch and the snapshot; failed refreshes and status messages don't
+        if data and data.get("temp") is not None:
             self._last_fetch = data
-            self._update_ui_from_data(data)
-        except Exception as e:
-            self._update_ui_from_data({"condition": f"Error: {e}"})
+            save_snapshot(data)
+        self._update_ui_from_data(data)
+
+    def on_stop(self):
+        self.anims.cancel()
+        location_service.unsubscribe()
+        shutdown_engine()
+        self.history.close()
 
 if __name__ == '__main__':
     SpaceWeatherApp().run()
@@ -0,0 +1,85 @@
+"""Gazetteer index: prefix-table and range lookups, exact lookups and rebuilds.
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import csv, os, tempfile, unittest
+
+import gazetteer
+from gazetteer import Gazetteer, build_index, normalize
+
+CITIES = [
+    ("London", "England", "GB", 51.5085, -0.1257, 8961989),
+    ("London", "Ontario", "CA", 42.9834, -81.2330, 346765),
+    ("Londrina", "Parana", "BR", -23.3103, -51.1628, 575377),
+    ("Long Beach", "California", "US", 33.7670, -118.1892, 466742),
+    ("Lomé", "Maritime", "TG", 6.1375, 1.2123, 749700),
+    ("São Paulo", "Sao Paulo", "BR", -23.5475, -46.6361, 10021295),
+    ("Portland", "Oregon", "US", 45.5234, -122.6762, 632309),
+    ("Portland", "Maine", "US", 43.6591, -70.2568, 66881),
+]
+
+
+class GazetteerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.dir.name, "cities.csv")
+        self.index = os.path.join(self.dir.name, "cities.idx")
+        with open(self.source, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["name", "region", "country", "lat", "lon", "population"])
+            w.writerows(CITIES)
+        self.gz = Gazetteer(self.index, self.source)
+
+    def tearDown(self):
+        self.gz.close()
+        self.dir.cleanup()
+
+    def names(self, text, limit=gazetteer.SUGGEST_LIMIT):
+        return [(p[2], p[4]) for p in self.gz.suggest(text, limit)]
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  São   Paulo "), "sao paulo")
+        self.assertEqual(normalize("St. John's"), "st johns")
+
+    def test_short_prefix_from_the_table_ranked_by_population(self):
+        self.assertFalse(os.path.exists(self.index))  # built on first use
+        self.assertEqual(self.names("lon"), [("London", "GB"), ("Londrina", "BR"), ("Long Beach", "US"),
+                                             ("London", "CA")])
+        self.assertEqual(self.names("L", 2), [("London", "GB"), ("Lomé", "TG")])
+        self.assertEqual(self.names("sao"), [("São Paulo", "BR")])
+        self.assertEqual(self.names("x"), [])
+        self.assertEqual(self.names(""), [])
+
+    def test_table_and_range_scan_agree(self):
+        for text in ("l", "lo", "lon", "lond", "po", "s"):
+            table = self.gz.suggest(text, gazetteer.PREFIX_TOP)
+            scan = self.gz.suggest(text, gazetteer.PREFIX_TOP + 1)  # over PREFIX_TOP: binary-searched range
+            self.assertEqual(table, scan[:len(table)], text)
+
+    def test_prefix_longer_than_the_table(self):
+        self.assertEqual(self.names("london"), [("London", "GB"), ("London", "CA")])
+        self.assertEqual(self.names("long b"), [("Long Beach", "US")])
+        self.assertEqual(self.names("londonx"), [])
+
+    def test_lookup_with_qualifiers(self):
+        self.assertEqual(self.gz.lookup("London")[4], "GB")
+        self.assertEqual(self.gz.lookup("london, ca")[3], "Ontario")
+        self.assertEqual(self.gz.lookup("Portland, Maine")[0], 43.6591)
+        self.assertIsNone(self.gz.lookup("Portland, Texas"))
+        self.assertIsNone(self.gz.lookup("Lon"))  # exact names only
+        self.assertEqual(self.gz.stats(), {"suggest": 0, "lookups": 5, "hits": 3})
+
+    def test_index_in_another_format_is_rebuilt(self):
+        with open(self.index, "wb") as f:
+            f.write(b"WXGZ\xff\xff" + b"\0" * 64)
+        os.utime(self.index, (os.path.getmtime(self.source) + 60,) * 2)  # newer than the source
+        self.assertEqual(len(self.gz), len(CITIES))
+        self.assertEqual(self.names("lomé"), [("Lomé", "TG")])
+
+    def test_build_index_returns_the_city_count(self):
+        self.assertEqual(build_index(self.source, self.index), len(CITIES))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""SeriesFile ring behaviour: wrap-around, range queries and reopening.
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os, tempfile, unittest
+
+from timeseries import SeriesFile
+
+
+def _values(i):
+    return (i, 0, 0, 0, 0, 0, 0)
+
+
+class SeriesFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "ring.bin")
+        self.ring = SeriesFile(self.path, 5)
+
+    def tearDown(self):
+        self.ring.close()
+        self.dir.cleanup()
+
+    def fill(self, n):
+        for i in range(n):
+            self.ring.append(1000 + 10 * i, _values(i))
+
+    def timestamps(self, start=None, end=None):
+        return [r[0] for r in self.ring.records(start, end)]
+
+    def test_before_wrapping(self):
+        self.fill(3)
+        self.assertEqual(len(self.ring), 3)
+        self.assertEqual(self.timestamps(), [1000, 1010, 1020])
+        self.assertEqual(self.ring.last_ts(), 1020)
+
+    def test_wrap_keeps_the_newest_capacity_records(self):
+        self.fill(8)  # slots wrap: oldest three are overwritten
+        self.assertEqual(len(self.ring), 5)
+        self.assertEqual(self.timestamps(), [1030, 1040, 1050, 1060, 1070])
+        self.assertEqual([r[1] for r in self.ring.records()], [3, 4, 5, 6, 7])
+
+    def test_range_across_the_ring_end(self):
+        self.fill(8)  # logical order starts at slot 3, so [1040, 1060] spans slots 4, 0, 1
+        self.assertEqual(self.timestamps(1040, 1060), [1040, 1050, 1060])
+        self.assertEqual(self.timestamps(1035, 1055), [1040, 1050])
+        self.assertEqual(self.timestamps(start=1060), [1060, 1070])
+        self.assertEqual(self.timestamps(end=1030), [1030])
+        self.assertEqual(self.timestamps(0, 1020), [])  # overwritten
+        self.assertEqual(self.timestamps(2000, 3000), [])
+
+    def test_reopen_keeps_the_ring(self):
+        self.fill(7)
+        self.ring.close()
+        self.ring = SeriesFile(self.path, 5)
+        self.assertEqual(self.timestamps(), [1020, 1030, 1040, 1050, 1060])
+        self.ring.append(1070, _values(7))
+        self.assertEqual(self.timestamps(1050), [1050, 1060, 1070])
+
+    def test_damaged_file_starts_over(self):
+        self.fill(2)
+        self.ring.close()
+        with open(self.path, "r+b") as f:
+            f.write(b"JUNK")
+        self.ring = SeriesFile(self.path, 5)
+        self.assertEqual(len(self.ring), 0)
+        self.assertIsNone(self.ring.last_ts())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+"""Behaviour of the refresh pool, single-flight coordination and provider rate limiting.
+
+Stdlib only: HTTP goes to a stub session, nothing touches the network or Kivy.
+Run from the repository root: python -m unittest discover tests
+"""
+
+import threading, time, unittest
+from email.utils import formatdate
+
+import weather_core as wc
+
+
+def _block(pool):
+    """Occupy every worker of `pool` until the returned event is set."""
+    release = threading.Event()
+    for _ in range(pool.stats()["workers"]):
+        started = threading.Event()
+        pool.submit(lambda s=started: (s.set(), release.wait(5)), priority=-1)
+        started.wait(5)
+    return release
+
+
+class _Response:
+    def __init__(self, status_code, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return self._body
+
+
+class _Session:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = wc.WorkerPool(1, name="test")
+
+    def test_lower_priority_value_runs_first_fifo_within_priority(self):
+        release = _block(self.pool)
+        order = []
+        futs = [self.pool.submit(order.append, "bg1"),
+                self.pool.submit(order.append, "user1", priority=wc.PRIORITY_USER),
+                self.pool.submit(order.append, "bg2"),
+                self.pool.submit(order.append, "user2", priority=wc.PRIORITY_USER)]
+        release.set()
+        for f in futs:
+            f.result(5)
+        self.assertEqual(order, ["user1", "user2", "bg1", "bg2"])
+
+    def test_replace_key_drops_the_queued_entry(self):
+        release = _block(self.pool)
+        ran = []
+        old = self.pool.submit(ran.append, "old", replace_key="periodic")
+        new = self.pool.submit(ran.append, "new", replace_key="periodic")
+        self.assertTrue(old.cancelled())
+        release.set()
+        new.result(5)
+        self.assertEqual(ran, ["new"])
+        st = self.pool.stats()
+        self.assertEqual(st["dropped"], 1)
+        self.assertEqual(st["queued"], 0)
+
+    def test_exception_reaches_the_future(self):
+        fut = self.pool.submit(lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            fut.result(5)
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = wc.WorkerPool(1, name="test")
+        self.flight = wc.SingleFlight(self.pool)
+        self.published = []
+
+    def run_flight(self, key, value, **kwargs):
+        calls = kwargs.pop("calls", [])
+        return self.flight.run(key, lambda: calls.append(value) or value,
+                               publish=self.published.append, **kwargs)
+
+    def test_same_key_joins_the_run_in_flight(self):
+        release = _block(self.pool)
+        a = self.run_flight("k", "a")
+        b = self.run_flight("k", "b")
+        self.assertIs(a, b)
+        release.set()
+        self.assertEqual(a.result(5), "a")
+
+    def test_supersede_cancels_queued_runs_without_calling_them(self):
+        release = _block(self.pool)
+        calls = []
+        old = self.run_flight("old", "old", calls=calls, priority=wc.PRIORITY_USER)
+        new = self.run_flight("new", "new", calls=calls, supersede=True, priority=wc.PRIORITY_USER)
+        self.assertTrue(old.cancelled())
+        release.set()
+        self.assertEqual(new.result(5), "new")
+        self.pool.submit(lambda: None).result(5)  # old's queued task has been skipped by now
+        self.assertEqual(calls, ["new"])
+        self.assertEqual(self.published, ["new"])
+
+    def test_background_run_joins_an_in_flight_user_run(self):
+        release = _block(self.pool)
+        search = self.run_flight(("search", "paris"), "paris", supersede=True, priority=wc.PRIORITY_USER)
+        periodic = self.run_flight(("coords", None, None), "here")
+        self.assertIs(periodic, search)
+        release.set()
+        self.assertEqual(search.result(5), "paris")
+        self.assertEqual(self.published, ["paris"])
+
+    def test_older_generation_never_publishes_over_a_newer_one(self):
+        first, second = self.flight.begin(), self.flight.begin()
+        self.assertTrue(self.flight.publish(second, self.published.append, "new"))
+        self.assertFalse(self.flight.publish(first, self.published.append, "old"))
+        self.assertEqual(self.published, ["new"])
+        # late partials of the generation on screen still fill it in; older ones don't
+        self.assertTrue(self.flight.publish_partial(second, self.published.append, "late"))
+        self.assertFalse(self.flight.publish_partial(first, self.published.append, "stale"))
+        self.assertEqual(self.published, ["new", "late"])
+
+    def test_supersede_makes_older_generations_stale(self):
+        old = self.flight.begin()
+        self.flight.begin(supersede=True)
+        self.assertFalse(self.flight.publish(old, self.published.append, "old"))
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.limiter = wc.RateLimiter({"p": ((2, 0.5),)})  # 2 calls, refilled at 4/s
+
+    def test_fail_fast_when_the_bucket_is_empty(self):
+        self.assertTrue(self.limiter.acquire("p", "k"))
+        self.assertTrue(self.limiter.acquire("p", "k"))
+        self.assertFalse(self.limiter.acquire("p", "k"))
+        self.assertTrue(self.limiter.acquire("p", "other key"))
+        self.assertTrue(self.limiter.acquire("unlimited", "k"))
+        self.assertEqual(self.limiter.headroom("p", "k"), 0)
+        self.assertIsNone(self.limiter.headroom("unlimited", "k"))
+
+    def test_wait_sleeps_until_the_next_token(self):
+        self.limiter.acquire("p", "k")
+        self.limiter.acquire("p", "k")
+        started = time.monotonic()
+        self.assertTrue(self.limiter.acquire("p", "k", wait=2))
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(self.limiter.stats()["waited"], 1)
+
+    def test_wait_shorter_than_the_refill_fails(self):
+        self.limiter.acquire("p", "k")
+        self.limiter.acquire("p", "k")
+        self.assertFalse(self.limiter.acquire("p", "k", wait=0.05))
+
+    def test_waiting_callers_reserve_tokens_in_order(self):
+        self.limiter.acquire("p", "k")
+        self.limiter.acquire("p", "k")
+        self.assertTrue(self.limiter.acquire("p", "k", wait=2))  # ~0.25 s
+        started = time.monotonic()
+        self.assertTrue(self.limiter.acquire("p", "k", wait=2))  # queued behind it: ~0.25 s more
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_retry_after_blocks_the_key(self):
+        err = self.limiter.throttled("p", "k", "0.3")
+        self.assertIsInstance(err, wc.RateLimited)
+        self.assertFalse(self.limiter.acquire("p", "k"))
+        self.assertEqual(self.limiter.headroom("p", "k"), 0)
+        started = time.monotonic()
+        self.assertTrue(self.limiter.acquire("p", "k", wait=2))
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_retry_after_formats(self):
+        self.assertEqual(wc._retry_after_seconds("12"), 12.0)
+        self.assertEqual(wc._retry_after_seconds(None), wc.RATE_LIMIT_BACKOFF)
+        self.assertEqual(wc._retry_after_seconds("soon", default=7), 7)
+        self.assertAlmostEqual(wc._retry_after_seconds(formatdate(time.time() + 30, usegmt=True)), 30, delta=2)
+        self.assertEqual(wc._retry_after_seconds(formatdate(time.time() - 30, usegmt=True)), 0.0)
+
+
+class ProviderGetTest(unittest.TestCase):
+    def setUp(self):
+        self._saved = wc.rate_limiter, wc._http
+        wc.rate_limiter = wc.RateLimiter({"p": ((5, 60),)})
+
+    def tearDown(self):
+        wc.rate_limiter, wc._http = self._saved
+
+    def test_429_raises_and_blocks_for_retry_after(self):
+        wc._http = _Session(_Response(429, {"Retry-After": "120"}))
+        with self.assertRaises(wc.RateLimited):
+            wc._provider_get("p", "k", "https://example.invalid/a")
+        with self.assertRaises(wc.RateLimited):
+            wc._provider_get("p", "k", "https://example.invalid/b")  # blocked locally, no request made
+        self.assertEqual(wc._http.urls, ["https://example.invalid/a"])
+        self.assertEqual(wc.rate_limiter.stats()["throttled"], 1)
+
+    def test_ok_response_is_decoded(self):
+        wc._http = _Session(_Response(200, body={"ok": True}))
+        self.assertEqual(wc._provider_get("p", "k", "https://example.invalid/"), {"ok": True})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+"""
+timeseries.py
+Compact on-disk history of readings: temp, humidity, wind, pressure, aqi, pm2_5, pm10.
+
+One memory-mapped ring file per location (geohash cell, like the response cache) under
+HISTORY_DIR. Records are fixed-size (18 bytes: uint32 unix time + 7 int16 fixed-point
+values), appended in time order and overwritten oldest-first once the ring is full, so
+retention is bounded by HISTORY_RETENTION. Opening a file is just an mmap, and range
+queries binary-search the timestamps and unpack only the matching slice.
+
+Sizing: 30 days at one sample per 10 min is 4320 records = ~78 KB per location (files
+are sparse, so only written records take disk space); 100 sites = ~8 MB.
+
+GUI-free; RefreshPipeline(history=TimeSeriesStore()) appends every reading it builds.
+"""
+
+import math, mmap, os, struct, threading, time
+
+from weather_core import geohash
+
+# ----- CONFIG -----
+HISTORY_DIR = os.path.join(os.path.expanduser("~"), ".spaceweather_history")
+HISTORY_RETENTION = 30 * 24 * 3600
+HISTORY_MIN_INTERVAL = 10 * 60  # samples closer than this to the previous one are dropped
+HISTORY_PRECISION = 6  # geohash chars of a location (~1.2 x 0.6 km)
+
+FIELDS = ("temp", "humidity", "wind", "pressure", "aqi", "pm2_5", "pm10")
+# fixed-point scale per field; values are stored as round(value * scale) in an int16
+_SCALES = (100, 10, 100, 10, 1, 10, 10)
+_MISSING = -32768
+
+_HEADER = struct.Struct("<4sHHIII")  # magic, version, record size, capacity, head, count
+_HEADER_SIZE = 32
+_RECORD = struct.Struct("<I7h")
+_MAGIC = b"WXTS"
+_VERSION = 1
+
+
+def _encode(value, scale):
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return _MISSING
+    if math.isnan(v):
+        return _MISSING
+    return max(-32767, min(32767, int(round(v * scale))))
+
+
+class SeriesFile:
+    """Fixed-capacity ring of records in one mmap'd file; not thread-safe on its own."""
+
+    def __init__(self, path, capacity):
+        self.path = path
+        size = _HEADER_SIZE + capacity * _RECORD.size
+        exists = os.path.exists(path)
+        self._fh = open(path, "r+b" if exists else "w+b")
+        if not exists or os.path.getsize(path) < _HEADER_SIZE:
+            self._fh.truncate(size)
+            self._init_header(capacity)
+        self._map = mmap.mmap(self._fh.fileno(), 0)
+        magic, version, rec_size, cap, head, count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION or rec_size != _RECORD.size \
+                or len(self._map) < _HEADER_SIZE + cap * rec_size:
+            # unknown or damaged file: start over
+            self._map.close()
+            self._fh.truncate(size)
+            self._init_header(capacity)
+            self._map = mmap.mmap(self._fh.fileno(), 0)
+            cap, head, count = capacity, 0, 0
+        self.capacity, self._head, self._count = cap, head, count
+
+    def _init_header(self, capacity):
+        self._fh.seek(0)
+        self._fh.write(_HEADER.pack(_MAGIC, _VERSION, _RECORD.size, capacity, 0, 0))
+        self._fh.flush()
+
+    def __len__(self):
+        return self._count
+
+    def _slot(self, i):
+        # physical slot of the i-th oldest record
+        return (self._head - self._count + i) % self.capacity
+
+    def _ts(self, i):
+        return struct.unpack_from("<I", self._map, _HEADER_SIZE + self._slot(i) * _RECORD.size)[0]
+
+    def last_ts(self):
+        return self._ts(self._count - 1) if self._count else None
+
+    def append(self, ts, values):
+        _RECORD.pack_into(self._map, _HEADER_SIZE + self._head * _RECORD.size, int(ts), *values)
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        _HEADER.pack_into(self._map, 0, _MAGIC, _VERSION, _RECORD.size, self.capacity, self._head, self._count)
+
+    def _bisect(self, ts):
+        # first logical index whose timestamp is >= ts
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts(mid) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def records(self, start=None, end=None):
+        """Raw (ts, v0..v6) tuples with start <= ts <= end, oldest first."""
+        lo = 0 if start is None else self._bisect(start)
+        hi = self._count if end is None else self._bisect(end + 1)
+        out = []
+        while lo < hi:
+            # at most two contiguous runs when the range wraps around the ring end
+            slot = self._slot(lo)
+            n = min(hi - lo, self.capacity - slot)
+            offset = _HEADER_SIZE + slot * _RECORD.size
+            out.extend(_RECORD.iter_unpack(self._map[offset:offset + n * _RECORD.size]))
+            lo += n
+        return out
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.close()
+        self._fh.close()
+
+
+class TimeSeriesStore:
+    """Per-location history of readings, shared by all threads.
+
+    append(reading) takes the dicts build_reading makes (needs lat/lon and uses
+    fetched_at); query() returns columns {"ts": [...], "temp": [...], ...} with None for
+    values that were missing.
+    """
+
+    def __init__(self, directory=HISTORY_DIR, retention=HISTORY_RETENTION, min_interval=HISTORY_MIN_INTERVAL,
+                 precision=HISTORY_PRECISION):
+        self.directory = directory
+        self.retention = retention
+        self.min_interval = min_interval
+        self.precision = precision
+        self.capacity = max(1, int(math.ceil(retention / min_interval)))
+        self._lock = threading.Lock()
+        self._files = {}  # location key -> SeriesFile
+
+    def location_key(self, lat, lon):
+        return geohash(float(lat), float(lon), self.precision)
+
+    def _file_locked(self, key, create):
+        f = self._files.get(key)
+        if f is None:
+            path = os.path.join(self.directory, key + ".wxts")
+            if not create and not os.path.exists(path):
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+            f = self._files[key] = SeriesFile(path, self.capacity)
+        return f
+
+    def append(self, reading):
+        """Record one reading; False if it has no location, is too close to the last sample or can't be stored."""
+        lat, lon = reading.get("lat"), reading.get("lon")
+        if lat is None or lon is None or reading.get("temp") is None:
+            return False
+        ts = int(reading.get("fetched_at") or time.time())
+        values = [_encode(reading.get(name), scale) for name, scale in zip(FIELDS, _SCALES)]
+        try:
+            with self._lock:
+                f = self._file_locked(self.location_key(lat, lon), create=True)
+                last = f.last_ts()
+                if last is not None and ts - last < self.min_interval:
+                    return False
+                f.append(ts, values)
+                return True
+        except Exception:
+            return False
+
+    def query(self, lat, lon, start=None, end=None, fields=FIELDS):
+        """Samples for the location with start <= ts <= end (unix seconds) as columns, oldest first."""
+        if start is None:
+            start = time.time() - self.retention
+        columns = {"ts": []}
+        columns.update((name, []) for name in fields)
+        wanted = [(name, FIELDS.index(name) + 1, _SCALES[FIELDS.index(name)]) for name in fields]
+        with self._lock:
+            f = self._file_locked(self.location_key(lat, lon), create=False)
+            rows = f.records(start, end) if f is not None else []
+        for row in rows:
+            columns["ts"].append(row[0])
+            for name, idx, scale in wanted:
+                v = row[idx]
+                columns[name].append(None if v == _MISSING else (v if scale == 1 else v / scale))
+        return columns
+
+    def locations(self):
+        """Location keys that have a history file."""
+        try:
+            return sorted(n[:-5] for n in os.listdir(self.directory) if n.endswith(".wxts"))
+        except OSError:
+            return []
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                try:
+                    f.flush()
+                    f.close()
+                except Exception:
+                    pass
+            self._files.clear()
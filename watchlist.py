@@ -0,0 +1,132 @@
+"""
+watchlist.py
+Saved cities for the watchlist screen, refreshed in rate-aware batches.
+
+Each refresh_batch() takes the cities whose cached weather has expired, at most
+WATCHLIST_BATCH of them and never more than the OWM quota has room for right now
+(rate_limiter.headroom), fetches them together through fetch_readings and hands back
+only the rows whose display text changed. AQI comes from the OWM components
+(estimate_aqi), as IQAir's quota can't cover a long list.
+
+GUI-free; the Kivy side feeds the rows into a RecycleView.
+"""
+
+import json, os, threading, time
+
+import weather_core
+from weather_core import (
+    aqi_category_and_color, build_reading, fetch_readings, rate_limiter, response_cache, write_json_atomic,
+)
+
+# ----- CONFIG -----
+WATCHLIST_PATH = os.path.join(os.path.expanduser("~"), ".spaceweather_watchlist.json")
+WATCHLIST_BATCH = 20  # cities per refresh batch
+OWM_CALLS_PER_CITY = 2  # weather + air pollution
+
+
+def watch_key(lat, lon):
+    return f"{float(lat):.4f},{float(lon):.4f}"
+
+
+def format_watch_row(entry, reading=None):
+    """RecycleView row (display strings only) for a saved city and its latest reading."""
+    row = {"key": entry["key"], "name_text": entry["name"], "region_text": entry.get("region", ""),
+           "temp_text": "--°C", "aqi_text": "--", "aqi_color": [1, 1, 1, 1], "pm25_text": "PM2.5 --"}
+    if reading:
+        if reading.get("temp") is not None:
+            row["temp_text"] = f"{float(reading['temp']):.0f}°C"
+        if reading.get("aqi") is not None:
+            row["aqi_text"] = str(reading["aqi"])
+            row["aqi_color"] = aqi_category_and_color(reading["aqi"])[2]
+        if reading.get("pm2_5") is not None:
+            row["pm25_text"] = f"PM2.5 {float(reading['pm2_5']):.1f}"
+    return row
+
+
+class Watchlist:
+    """Saved cities (persisted as JSON) plus the last row shown for each."""
+
+    def __init__(self, path=WATCHLIST_PATH, batch_size=WATCHLIST_BATCH):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._entries = []  # [{"key", "name", "region", "lat", "lon"}]
+        self._rows = {}  # key -> last formatted row
+        self._cursor = 0  # round-robin start, so a long list doesn't starve its tail
+        self._stats = {"batches": 0, "fetched": 0, "changed": 0, "deferred": 0}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = [e for e in json.load(f) if "lat" in e and "lon" in e]
+        except Exception:
+            entries = []
+        with self._lock:
+            self._entries = [dict(e, key=watch_key(e["lat"], e["lon"])) for e in entries]
+
+    def save(self):
+        with self._lock:
+            entries = [{k: e[k] for k in ("name", "region", "lat", "lon")} for e in self._entries]
+        return write_json_atomic(self.path, entries)
+
+    def add(self, name, region, lat, lon):
+        """Save a city; False if that place is already on the list."""
+        key = watch_key(lat, lon)
+        with self._lock:
+            if any(e["key"] == key for e in self._entries):
+                return False
+            self._entries.append({"key": key, "name": name, "region": region or "", "lat": lat, "lon": lon})
+        self.save()
+        return True
+
+    def remove(self, key):
+        with self._lock:
+            self._entries = [e for e in self._entries if e["key"] != key]
+            self._rows.pop(key, None)
+        self.save()
+
+    def rows(self):
+        """Rows for every saved city, in list order (last known values or placeholders)."""
+        with self._lock:
+            return [self._rows.get(e["key"]) or format_watch_row(e) for e in self._entries]
+
+    def refresh_batch(self, now=None):
+        """Refresh up to one batch of due cities; returns the rows whose display changed."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entries = list(self._entries)
+            start = self._cursor % len(entries) if entries else 0
+        entries = entries[start:] + entries[:start]
+        due = [e for e in entries
+               if e["key"] not in self._rows or (response_cache.expires_at("weather", e["lat"], e["lon"]) or 0) <= now]
+        headroom = rate_limiter.headroom("owm", weather_core.OWM_API_KEY)
+        limit = self.batch_size if headroom is None else min(self.batch_size, headroom // OWM_CALLS_PER_CITY)
+        batch = due[:limit]
+        if not batch:
+            with self._lock:
+                self._stats["deferred"] += len(due)
+            return []
+        results = fetch_readings([(e["lat"], e["lon"]) for e in batch])
+        changed = []
+        with self._lock:
+            for e, r in zip(batch, results):
+                row = format_watch_row(e, build_reading(r, e["name"], e["region"], e["lat"], e["lon"]))
+                if row != self._rows.get(e["key"]):
+                    self._rows[e["key"]] = row
+                    changed.append(row)
+            self._cursor = start + len(batch)
+            self._stats["batches"] += 1
+            self._stats["fetched"] += len(batch)
+            self._stats["changed"] += len(changed)
+            self._stats["deferred"] += len(due) - len(batch)
+        return changed
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Batches run, cities fetched, rows that changed, and due cities deferred for quota."""
+        with self._lock:
+            return dict(self._stats, cities=len(self._entries))
@@ -0,0 +1,122 @@
+"""
+weather_batch.py
+Headless batch refresh: weather + AQI for many locations, streamed as JSON lines.
+
+Input (CSV file or stdin), one location per row:
+    lat,lon[,label]        e.g.  48.8566,2.3522,Paris office
+    city[,country]         e.g.  Pune,IN
+Each output line carries the same fields update_all builds (temp, condition, aqi,
+pm2_5, ...) plus the input `query` and resolved `lat`/`lon`. Records are written as
+soon as each location finishes, not in input order. Weather for places whose OWM city ID
+is already known (learned by earlier runs) goes out in `group` calls of up to 20 IDs.
+OWM calls wait for the free-tier quota (60/min, see --rate-limit for paid plans) rather
+than failing; IQAir is only used while its quota lasts, AQI is estimated from OWM after that.
+
+Usage:
+    OWM_API_KEY=... IQAIR_API_KEY=... python weather_batch.py sites.csv -p 32 -o out.jsonl
+"""
+
+import argparse, csv, json, sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import weather_core
+from weather_core import RateLimited, build_reading, fetch_providers, owm_geocode_city
+
+# ----- CONFIG -----
+RATE_WAIT = 15 * 60  # seconds an OWM call may wait for quota before the location is reported as an error
+
+
+def parse_row(row):
+    """(query, lat, lon, label) for one CSV row; lat/lon are None for a city query."""
+    fields = [f.strip() for f in row if f and f.strip()]
+    if not fields or fields[0].startswith("#"):
+        return None
+    if len(fields) >= 2:
+        try:
+            lat, lon = float(fields[0]), float(fields[1])
+            label = ",".join(fields[2:])
+            return f"{lat},{lon}", lat, lon, label
+        except ValueError:
+            pass
+    query = ",".join(fields)
+    return query, None, None, query
+
+
+def fetch_location(query, lat, lon, label):
+    city, region = label, ""
+    if lat is None:
+        try:
+            res = owm_geocode_city(query, weather_core.OWM_API_KEY)
+        except RateLimited as e:
+            return {"query": query, "error": str(e)}
+        if not res:
+            return {"query": query, "error": "City not found"}
+        lat, lon, city, state, country = res
+        region = state or country
+    try:
+        record = {"query": query, "lat": lat, "lon": lon}
+        record.update(build_reading(fetch_providers(lat, lon, batched=True), city, region, lat, lon))
+        return record
+    except Exception as e:
+        return {"query": query, "lat": lat, "lon": lon, "error": str(e)}
+
+
+def run_batch(rows, out, parallel=16):
+    """Fetch every parsed row with at most `parallel` locations in flight; returns the record count."""
+    written = 0
+    pending = set()
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="batch") as pool:
+        def drain():
+            nonlocal pending, written
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                out.write(json.dumps(fut.result(), ensure_ascii=False) + "\n")
+                out.flush()
+                written += 1
+
+        for row in rows:
+            loc = parse_row(row)
+            if loc is None:
+                continue
+            # keep the input streaming: never queue more than 2x parallelism
+            if len(pending) >= 2 * parallel:
+                drain()
+            pending.add(pool.submit(fetch_location, *loc))
+        while pending:
+            drain()
+    return written
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fetch weather + AQI for many locations as JSON lines.")
+    ap.add_argument("input", nargs="?", default="-", help="CSV file (default: stdin)")
+    ap.add_argument("-o", "--output", default="-", help="JSONL output file (default: stdout)")
+    ap.add_argument("-p", "--parallel", type=int, default=16, help="locations fetched concurrently")
+    ap.add_argument("--owm-key", help="OpenWeatherMap API key (default: $OWM_API_KEY)")
+    ap.add_argument("--iqair-key", help="IQAir API key (default: $IQAIR_API_KEY)")
+    ap.add_argument("--rate-limit", type=int, metavar="CALLS_PER_MIN",
+                    help="OWM calls per minute your plan allows (default: free tier, 60)")
+    args = ap.parse_args(argv)
+
+    parallel = max(1, args.parallel)
+    # each location fans out into three provider calls
+    weather_core.configure(owm_api_key=args.owm_key, iqair_api_key=args.iqair_key,
+                           provider_workers=3 * parallel, http_pool_size=parallel,
+                           rate_limits={"owm": ((args.rate_limit, 60),)} if args.rate_limit else None,
+                           rate_limit_wait={"owm": RATE_WAIT})
+
+    src = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        n = run_batch(csv.reader(src), out, parallel)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+    print(f"{n} locations written", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2179 @@
+"""
+weather_core.py
+GUI-free core shared by space.py, spaceweather.py and weather_batch.py:
+ - pooled HTTP client + OpenWeatherMap / IQAir / ipinfo provider helpers
+ - offline gazetteer lookups (gazetteer.py), geocode and spatial response caches
+ - location service (GPS subscription + cached ipinfo fallback)
+ - concurrent and asyncio provider pipelines, refresh worker pool, single-flight
+Nothing here imports Kivy, so scripts and servers can use it without a display.
+Heavier dependencies (requests, asyncio, sqlite3, concurrent.futures, plyer, aiohttp)
+are imported on first use, so `import weather_core` itself only costs a few ms
+(see bench_import.py).
+
+API keys default to the OWM_API_KEY / IQAIR_API_KEY environment variables; the apps
+pass their own through configure().
+"""
+
+import threading, time, heapq, itertools, os, math, random
+from collections import OrderedDict, deque
+
+_optional = {}
+
+def _optional_module(name):
+    """Import an optional dependency on first use; None if it isn't installed."""
+    if name not in _optional:
+        try:
+            _optional[name] = __import__(name, fromlist=["_"])
+        except Exception:
+            _optional[name] = None
+    return _optional[name]
+
+def _gps():
+    # optional plyer gps
+    plyer = _optional_module("plyer")
+    return getattr(plyer, "gps", None) if plyer is not None else None
+
+# ----- CONFIG -----
+OWM_API_KEY = os.environ.get("OWM_API_KEY", "")
+IQAIR_API_KEY = os.environ.get("IQAIR_API_KEY", "")
+PROVIDER_WORKERS = 6  # shared pool for the weather / AQI / pollution fan-out
+HTTP_POOL_SIZE = 10  # keep-alive connections kept per host
+HTTP_RETRIES = 2
+GEOCODE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".spaceweather_geocode.sqlite3")
+GEOCODE_CACHE_SIZE = 512
+GEOCODE_TTL = 30 * 24 * 3600  # city coordinates practically never change
+GEOCODE_NEGATIVE_TTL = 24 * 3600
+SUGGEST_LIMIT = 6  # city suggestions shown while typing
+SUGGEST_MIN_CHARS = 2  # shorter input gets no suggestions
+SUGGEST_NETWORK_MIN_CHARS = 3  # shorter input is never geocoded online
+SNAPSHOT_PATH = os.path.join(os.path.expanduser("~"), ".spaceweather_snapshot.json")
+SPATIAL_CACHE_PRECISION = 6  # geohash chars; 6 = ~1.2 x 0.6 km cells
+SPATIAL_CACHE_SIZE = 2048
+# each provider's own update cadence; a response stays fresh until the next update is due
+PROVIDER_TTL = {"weather": 10 * 60, "pollution": 60 * 60, "iqair": 60 * 60, "forecast": 3 * 3600}
+PROVIDER_PUBLISH_LAG = 60  # seconds a provider typically needs to publish after the nominal update
+SCHEDULE_MIN_DELAY = 2 * 60  # never poll more often than this, also the re-check delay for late data
+SCHEDULE_MAX_DELAY = 60 * 60
+SCHEDULE_JITTER = 15  # seconds of random spread so many clients don't poll in lockstep
+BACKOFF_BASE = 30  # first retry delay after a failed refresh; doubles per consecutive failure
+BACKOFF_MAX = 30 * 60
+REFRESH_DEADLINE = 2.0  # seconds one refresh may take before slow providers are degraded
+LOCATE_BUDGET_SHARE = 0.4  # share of the deadline locating may use before the last known fix is taken
+IQAIR_BUDGET_SHARE = 0.6  # share of the provider budget IQAir gets before AQI is estimated locally
+OWM_GROUP_MAX = 20  # city IDs per OWM `group` call
+WEATHER_BATCH_WINDOW = 0.05  # seconds a batched weather lookup waits for others to share its group call
+# (calls, per seconds) quotas per provider and API key: IQAir community and OWM free tiers
+RATE_LIMITS = {"owm": ((60, 60),), "iqair": ((5, 60), (500, 24 * 3600))}
+RATE_LIMIT_BACKOFF = 60  # seconds to back off after a 429 without a usable Retry-After
+# seconds a blocking provider call may wait for its quota, per provider; 0 = fail fast and
+# serve cached data (the apps). weather_batch waits for OWM instead of writing error records.
+RATE_LIMIT_WAIT = {}
+LOCATION_MAX_AGE = 10 * 60  # re-acquire the location fix after this many seconds
+LOCATION_MOVE_THRESHOLD = 250  # metres; closer fixes count as "not moved"
+IP_LOCATION_TTL = 6 * 3600
+IP_FIX_ACCURACY = 5000  # metres, rough accuracy of an ipinfo fix
+GPS_MIN_TIME_MS = 10000  # interval of the continuous GPS subscription
+GPS_FIX_TIMEOUT = 6  # seconds to wait for a first fix before falling back to ipinfo
+
+# ---------- Shared HTTP client ----------
+def make_http_session(pool_size=None, retries=None):
+    """Session with keep-alive per-host connection pools and a retry policy for transient errors.
+
+    Defaults are read at call time, so a session rebuilt after configure(http_pool_size=...) gets the new size.
+    """
+    pool_size = pool_size or HTTP_POOL_SIZE
+    retries = HTTP_RETRIES if retries is None else retries
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    retry = Retry(total=retries, connect=retries, read=retries, backoff_factor=0.3,
+                  status_forcelist=(502, 503, 504), allowed_methods=frozenset(["GET"]))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# one long-lived client for ipinfo.io, api.openweathermap.org and api.airvisual.com
+_http = None
+_http_lock = threading.Lock()
+
+def get_http():
+    global _http
+    if _http is None:
+        with _http_lock:
+            if _http is None:
+                _http = make_http_session()
+    return _http
+
+IPINFO_URL = "https://ipinfo.io/json"
+
+# ---------- Provider rate limits ----------
+class RateLimited(Exception):
+    """The provider quota for an API key is used up, locally or because the API answered 429."""
+
+def _retry_after_seconds(value, default=RATE_LIMIT_BACKOFF):
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return default
+
+class RateLimiter:
+    """Token buckets per (provider, API key), shared by every thread in the process.
+
+    Each provider gets one bucket per quota in RATE_LIMITS (e.g. per minute and per day)
+    and a call needs a token from all of them. By default acquire() never blocks: over
+    quota it returns False so the caller can serve cached data instead. With wait > 0 it
+    reserves the next free token (callers are served in arrival order) and sleeps until
+    then, unless that is more than `wait` seconds away. A 429 answer blocks the key until
+    its Retry-After has passed.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = dict(RATE_LIMITS if limits is None else limits)
+        self._lock = threading.Lock()
+        self._buckets = {}  # (provider, key) -> [[tokens, last_refill], ...], one per quota
+        self._blocked_until = {}  # (provider, key) -> monotonic time
+        self._stats = {"allowed": 0, "limited": 0, "throttled": 0, "fallbacks": 0, "waited": 0, "wait_total": 0.0}
+
+    def acquire(self, provider, key, wait=0):
+        """Take one call from the (provider, key) quota; False if it is used up or blocked for longer than `wait`."""
+        quotas = self.limits.get(provider, ())
+        now = time.monotonic()
+        with self._lock:
+            buckets = self._buckets.get((provider, key))
+            if buckets is None:
+                buckets = self._buckets[(provider, key)] = [[float(calls), now] for calls, _per in quotas]
+            for (calls, per), bucket in zip(quotas, buckets):
+                bucket[0] = min(calls, bucket[0] + (now - bucket[1]) * calls / per)
+                bucket[1] = now
+            # seconds until the key is unblocked and every bucket has a token for this call
+            delay = max([self._blocked_until.get((provider, key), 0) - now]
+                        + [(1 - bucket[0]) * per / calls for (calls, per), bucket in zip(quotas, buckets)])
+            if delay > wait:
+                self._stats["limited"] += 1
+                return False
+            for bucket in buckets:
+                bucket[0] -= 1  # below zero = reserved by a waiting caller
+            self._stats["allowed"] += 1
+            if delay > 0:
+                self._stats["waited"] += 1
+                self._stats["wait_total"] += delay
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def throttled(self, provider, key, retry_after=None):
+        """Record a 429 for (provider, key) and return the RateLimited error to raise."""
+        delay = _retry_after_seconds(retry_after)
+        with self._lock:
+            k = (provider, key)
+            self._blocked_until[k] = max(self._blocked_until.get(k, 0), time.monotonic() + delay)
+            self._stats["throttled"] += 1
+        return RateLimited(f"{provider} rate limited for {delay:.0f}s")
+
+    def headroom(self, provider, key):
+        """Calls (provider, key) could make right now without being limited; None if it has no quota."""
+        quotas = self.limits.get(provider, ())
+        now = time.monotonic()
+        with self._lock:
+            if self._blocked_until.get((provider, key), 0) > now:
+                return 0
+            if not quotas:
+                return None
+            buckets = self._buckets.get((provider, key)) or [[float(calls), now] for calls, _per in quotas]
+            return max(0, int(min(min(calls, tokens + (now - last) * calls / per)
+                                  for (calls, per), (tokens, last) in zip(quotas, buckets))))
+
+    def set_limits(self, limits):
+        """Override the quotas of some providers; their buckets start full again."""
+        with self._lock:
+            self.limits.update(limits)
+            for k in [k for k in self._buckets if k[0] in limits]:
+                del self._buckets[k]
+
+    def note_fallback(self):
+        with self._lock:
+            self._stats["fallbacks"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+rate_limiter = RateLimiter()
+
+def _provider_get(provider, key, url, timeout=8):
+    """GET url and decode JSON within the (provider, key) quota; raises RateLimited when over it."""
+    if not rate_limiter.acquire(provider, key, RATE_LIMIT_WAIT.get(provider, 0)):
+        raise RateLimited(f"{provider} quota used up")
+    r = get_http().get(url, timeout=timeout)
+    if r.status_code == 429:
+        raise rate_limiter.throttled(provider, key, r.headers.get("Retry-After"))
+    r.raise_for_status()
+    return r.json()
+
+# ---------- Spatial response cache ----------
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat, lon, precision=SPATIAL_CACHE_PRECISION):
+    """Standard geohash of (lat, lon); nearby points share a cell at a given precision."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon > mid:
+                ch = (ch << 1) | 1
+                lon_lo = mid
+            else:
+                ch <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat > mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+class SpatialCache:
+    """Thread-safe LRU of provider responses keyed on (provider, geohash cell).
+
+    GPS jitter stays inside one cell, so nearby lookups reuse the same response until it
+    expires: at the provider's predicted next update when the response carried an
+    observation timestamp (see next_update_at), else after its TTL (see PROVIDER_TTL).
+    """
+
+    def __init__(self, precision=SPATIAL_CACHE_PRECISION, ttls=None, max_entries=SPATIAL_CACHE_SIZE):
+        self.precision = precision
+        self.ttls = dict(PROVIDER_TTL if ttls is None else ttls)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()  # (provider, cell) -> (value, expires_at, observed_at)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, provider, lat, lon):
+        return provider, geohash(float(lat), float(lon), self.precision)
+
+    def get(self, provider, lat, lon):
+        k = self.key(provider, lat, lon)
+        with self._lock:
+            entry = self._mem.get(k)
+            if entry is None or entry[1] < time.time():
+                self.misses += 1
+                return None
+            self._mem.move_to_end(k)
+            self.hits += 1
+            return entry[0]
+
+    def expires_at(self, provider, lat, lon):
+        """Expiry time of the cached response for (provider, cell), or None if nothing is cached."""
+        with self._lock:
+            entry = self._mem.get(self.key(provider, lat, lon))
+            return entry[1] if entry is not None else None
+
+    def stale(self, provider, lat, lon):
+        """Cached response for (provider, cell) even if expired (None if evicted); not counted."""
+        with self._lock:
+            entry = self._mem.get(self.key(provider, lat, lon))
+            return entry[0] if entry is not None else None
+
+    def observed(self, provider, lat, lon):
+        """Provider observation time of the cached response for (provider, cell), or None if unknown."""
+        with self._lock:
+            entry = self._mem.get(self.key(provider, lat, lon))
+            return entry[2] if entry is not None else None
+
+    def put(self, provider, lat, lon, value, expires_at=None, observed=None):
+        k = self.key(provider, lat, lon)
+        if expires_at is None:
+            expires_at = time.time() + self.ttls.get(provider, 0)
+        with self._lock:
+            self._mem[k] = (value, expires_at, observed)
+            self._mem.move_to_end(k)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+response_cache = SpatialCache()
+
+def _stale_response(provider, lat, lon):
+    # over quota: an expired response beats no data
+    value = response_cache.stale(provider, lat, lon)
+    if value is not None:
+        rate_limiter.note_fallback()
+    return value
+
+# ---------- Geocode cache ----------
+def normalize_city_query(city_name):
+    return " ".join(city_name.lower().split())
+
+class GeocodeCache:
+    """Normalized-query LRU cache for owm_geocode_city with a long TTL, persisted to SQLite.
+
+    "City not found" is cached too (with a shorter TTL) so repeated typos don't hit the
+    network. Lookups are served from memory; the SQLite file only backs restarts. If the
+    file can't be opened the cache silently works in memory only.
+    """
+
+    MISS = object()
+
+    def __init__(self, path, max_entries=GEOCODE_CACHE_SIZE, ttl=GEOCODE_TTL, negative_ttl=GEOCODE_NEGATIVE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()  # query -> (result or None, expires_at)
+        self._db = None
+        self._loaded = False
+
+    def _load_locked(self):
+        self._loaded = True
+        try:
+            import sqlite3
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS geocode (q TEXT PRIMARY KEY, lat REAL, lon REAL, "
+                             "name TEXT, state TEXT, country TEXT, found INTEGER, expires REAL)")
+            now = time.time()
+            self._db.execute("DELETE FROM geocode WHERE expires < ?", (now,))
+            self._db.commit()
+            rows = self._db.execute("SELECT q, lat, lon, name, state, country, found, expires FROM geocode "
+                                    "ORDER BY expires DESC LIMIT ?", (self.max_entries,)).fetchall()
+            for q, lat, lon, name, state, country, found, expires in reversed(rows):
+                self._mem[q] = ((lat, lon, name, state, country) if found else None, expires)
+        except Exception:
+            self._db = None
+
+    def get(self, city_name):
+        """Cached result (None for a cached miss), or GeocodeCache.MISS if unknown/expired."""
+        q = normalize_city_query(city_name)
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            entry = self._mem.get(q)
+            if entry is None:
+                return self.MISS
+            if entry[1] < time.time():
+                del self._mem[q]
+                return self.MISS
+            self._mem.move_to_end(q)
+            return entry[0]
+
+    def put(self, city_name, result):
+        q = normalize_city_query(city_name)
+        expires = time.time() + (self.ttl if result else self.negative_ttl)
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            self._mem[q] = (result, expires)
+            self._mem.move_to_end(q)
+            while len(self._mem) > self.max_entries:
+                old_q, _ = self._mem.popitem(last=False)
+                self._execute_locked("DELETE FROM geocode WHERE q = ?", (old_q,))
+            row = tuple(result) if result else (None, None, "", "", "")
+            self._execute_locked("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (q,) + row + (1 if result else 0, expires))
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        """Found results of cached queries starting with `prefix`, most recently used first."""
+        q = normalize_city_query(prefix)
+        now = time.time()
+        out = []
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            for key, (result, expires) in reversed(self._mem.items()):
+                if result and expires >= now and key.startswith(q) and result not in out:
+                    out.append(result)
+                    if len(out) >= limit:
+                        break
+        return out
+
+    def _execute_locked(self, sql, params):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(sql, params)
+            self._db.commit()
+        except Exception:
+            pass
+
+geocode_cache = GeocodeCache(GEOCODE_CACHE_PATH)
+
+# ---------- Provider helpers ----------
+def _parse_ip_location(j):
+    loc = j.get("loc", "")
+    if loc:
+        lat_str, lon_str = loc.split(',')
+        city = j.get("city", "")
+        region = j.get("region", "")
+        country = j.get("country", "")
+        return float(lat_str), float(lon_str), city, region, country
+    return None
+
+def _parse_geocode(j):
+    if isinstance(j, list) and j:
+        entry = j[0]
+        return float(entry.get("lat")), float(entry.get("lon")), entry.get("name",""), entry.get("state",""), entry.get("country","")
+    return None
+
+def _parse_pollution(j):
+    if "list" in j and j["list"]:
+        return j["list"][0].get("components", {})
+    return None
+
+def _parse_iqair(j):
+    if j.get("status") == "success":
+        pollution = j.get("data", {}).get("current", {}).get("pollution", {})
+        aqi_val = pollution.get("aqius")
+        main = pollution.get("mainus") or pollution.get("maincn") or ""
+        return (int(aqi_val) if aqi_val is not None else None, main)
+    return (None, "")
+
+def observed_at(provider, j):
+    """Unix time of the observation (or forecast issue) in a raw provider response (OWM `dt`, IQAir `ts`), or None."""
+    try:
+        if provider == "weather":
+            return float(j["dt"])
+        if provider == "pollution":
+            return float(j["list"][0]["dt"])
+        if provider == "forecast":
+            # issued for the 3-hour slot before the first forecast step
+            return float(j["list"][0]["dt"]) - PROVIDER_TTL["forecast"]
+        if provider == "iqair":
+            from datetime import datetime
+            ts = j["data"]["current"]["pollution"]["ts"]
+            return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+    except Exception:
+        pass
+    return None
+
+def next_update_at(provider, j, now=None):
+    """Predicted time the provider publishes data newer than response `j`.
+
+    Observation time + the provider's cadence + publishing lag. Data that is already
+    overdue is re-checked after SCHEDULE_MIN_DELAY; without a timestamp the plain TTL applies.
+    """
+    now = time.time() if now is None else now
+    ts = observed_at(provider, j)
+    if ts is None:
+        return now + PROVIDER_TTL.get(provider, 0)
+    predicted = ts + PROVIDER_TTL.get(provider, 0) + PROVIDER_PUBLISH_LAG
+    return predicted if predicted > now else now + SCHEDULE_MIN_DELAY
+
+def _cache_response(provider, lat, lon, value, j):
+    # cached until the provider's next predicted update; the observation time feeds RefreshScheduler
+    response_cache.put(provider, lat, lon, value, next_update_at(provider, j), observed_at(provider, j))
+
+def _geocode_url(city_name, api_key, limit=1):
+    from urllib.parse import quote
+    q = quote(city_name)
+    return f"https://api.openweathermap.org/geo/1.0/direct?q={q}&limit={limit}&appid={api_key}"
+
+def _weather_url(lat, lon, api_key):
+    return f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
+
+def _pollution_url(lat, lon, api_key):
+    return f"https://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={api_key}"
+
+def _forecast_url(lat, lon, api_key):
+    return f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={api_key}&units=metric"
+
+def _group_url(city_ids, api_key):
+    ids = ",".join(str(i) for i in city_ids)
+    return f"https://api.openweathermap.org/data/2.5/group?id={ids}&appid={api_key}&units=metric"
+
+def _iqair_url(lat, lon, key):
+    return f"https://api.airvisual.com/v2/nearest_city?lat={lat}&lon={lon}&key={key}"
+
+def fetch_ip_location():
+    try:
+        r = get_http().get(IPINFO_URL, timeout=6)
+        if r.status_code == 200:
+            return _parse_ip_location(r.json())
+    except Exception:
+        pass
+    return None
+
+def local_geocode(city_name):
+    """Offline gazetteer match for a typed city (no network call), or None."""
+    try:
+        from gazetteer import gazetteer
+        return gazetteer.lookup(city_name)
+    except Exception:
+        return None
+
+def owm_geocode_city(city_name, api_key):
+    """(lat, lon, name, state, country), or None if not found or the lookup failed; raises RateLimited over quota."""
+    cached = geocode_cache.get(city_name)
+    if cached is not GeocodeCache.MISS:
+        return cached
+    try:
+        res = _parse_geocode(_provider_get("owm", api_key, _geocode_url(city_name, api_key)))
+    except RateLimited:
+        raise  # not "City not found": the caller says so
+    except Exception:
+        return None  # network/API failure: don't cache
+    geocode_cache.put(city_name, res)
+    return res
+
+def owm_geocode_suggestions(city_name, api_key, limit=SUGGEST_LIMIT):
+    """Up to `limit` OWM geocoding matches, or None on failure; the best one is cached for the search that follows."""
+    try:
+        j = _provider_get("owm", api_key, _geocode_url(city_name, api_key, limit))
+        res = [_parse_geocode([entry]) for entry in j] if isinstance(j, list) else []
+    except Exception:
+        return None
+    geocode_cache.put(city_name, res[0] if res else None)
+    return res
+
+def fetch_weather(lat, lon, api_key):
+    cached = response_cache.get("weather", lat, lon)
+    if cached is not None:
+        return cached
+    try:
+        j = _provider_get("owm", api_key, _weather_url(lat, lon, api_key))
+    except RateLimited:
+        stale = _stale_response("weather", lat, lon)
+        if stale is None:
+            raise
+        return stale
+    _cache_response("weather", lat, lon, j, j)
+    city_ids.put(lat, lon, j.get("id"))
+    return j
+
+def fetch_openweather_pollution(lat, lon, api_key):
+    cached = response_cache.get("pollution", lat, lon)
+    if cached is not None:
+        return cached
+    try:
+        j = _provider_get("owm", api_key, _pollution_url(lat, lon, api_key))
+        comps = _parse_pollution(j)
+        if comps:
+            _cache_response("pollution", lat, lon, comps, j)
+        return comps
+    except RateLimited:
+        return _stale_response("pollution", lat, lon)
+    except Exception:
+        pass
+    return None
+
+def fetch_aqi_iqair(lat, lon, key):
+    """IQAir nearest_city for aqius and main pollutant if present."""
+    cached = response_cache.get("iqair", lat, lon)
+    if cached is not None:
+        return cached
+    try:
+        j = _provider_get("iqair", key, _iqair_url(lat, lon, key))
+        res = _parse_iqair(j)
+        if res[0] is not None:
+            _cache_response("iqair", lat, lon, res, j)
+        return res
+    except RateLimited:
+        return _stale_response("iqair", lat, lon) or (None, "")
+    except Exception:
+        pass
+    return (None, "")
+
+# US EPA breakpoints: (conc_lo, conc_hi, aqi_lo, aqi_hi), concentrations in µg/m³
+_PM25_BREAKPOINTS = ((0.0, 12.0, 0, 50), (12.1, 35.4, 51, 100), (35.5, 55.4, 101, 150), (55.5, 150.4, 151, 200),
+                     (150.5, 250.4, 201, 300), (250.5, 350.4, 301, 400), (350.5, 500.4, 401, 500))
+_PM10_BREAKPOINTS = ((0, 54, 0, 50), (55, 154, 51, 100), (155, 254, 101, 150), (255, 354, 151, 200),
+                     (355, 424, 201, 300), (425, 504, 301, 400), (505, 604, 401, 500))
+
+def _sub_index(conc, breakpoints):
+    for c_lo, c_hi, i_lo, i_hi in breakpoints:
+        if conc <= c_hi:
+            return round((i_hi - i_lo) / (c_hi - c_lo) * (max(conc, c_lo) - c_lo) + i_lo)
+    return 500
+
+def estimate_aqi(pm2_5=None, pm10=None):
+    """US AQI from PM2.5 / PM10 concentrations as (aqi, main pollutant), main in IQAir's "p2"/"p1" codes.
+
+    Used when IQAir has no answer in time; (None, "") without any concentration.
+    """
+    candidates = []
+    try:
+        if pm2_5 is not None:
+            candidates.append((_sub_index(math.floor(float(pm2_5) * 10) / 10, _PM25_BREAKPOINTS), "p2"))
+        if pm10 is not None:
+            candidates.append((_sub_index(math.floor(float(pm10)), _PM10_BREAKPOINTS), "p1"))
+    except (TypeError, ValueError):
+        pass
+    return max(candidates) if candidates else (None, "")
+
+def aqi_category_and_color(aqi_value):
+    try:
+        aqi = int(aqi_value)
+    except Exception:
+        return "Unknown", "No data", [1,1,1,1]
+    if aqi <= 50:
+        return "Good", "Air quality is satisfactory.", [0.2, 0.8, 0.2, 1]
+    if aqi <= 100:
+        return "Moderate", "Acceptable; sensitive groups should be cautious.", [0.95, 0.8, 0.2, 1]
+    if aqi <= 150:
+        return "Unhealthy for SG", "Sensitive groups may experience health effects.", [0.9, 0.55, 0.12, 1]
+    if aqi <= 200:
+        return "Unhealthy", "Everyone may begin to experience health effects.", [0.9, 0.2, 0.2, 1]
+    if aqi <= 300:
+        return "Very Unhealthy", "Health alert: emergency conditions possible.", [0.6, 0.15, 0.45, 1]
+    return "Hazardous", "Health warnings of emergency conditions.", [0.5, 0.02, 0.02, 1]
+
+# ---------- View model ----------
+def weather_icon_for(condition, aqi=None):
+    """Emoji icon for a condition text, with a smoke overlay when AQI is unhealthy (> 150)."""
+    cond = (condition or "").lower()
+    icon = "☀️"
+    if "cloud" in cond:
+        icon = "☁️"
+    elif "rain" in cond or "drizzle" in cond:
+        icon = "🌧️"
+    elif "snow" in cond:
+        icon = "❄️"
+    elif "storm" in cond or "thunder" in cond:
+        icon = "⛈️"
+    elif "mist" in cond or "fog" in cond or "haze" in cond:
+        icon = "🌫️"
+    try:
+        if aqi is not None and int(aqi) > 150:
+            icon = icon + "💨"
+    except Exception:
+        pass
+    return icon
+
+def _format_number(value, fmt, unit, placeholder):
+    if value is None or value == "--":
+        return placeholder
+    try:
+        return fmt.format(float(value)) + unit
+    except Exception:
+        return str(value)
+
+def _age_text(seconds):
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min ago"
+    if seconds < 48 * 3600:
+        return f"{int(seconds // 3600)} h ago"
+    return f"{int(seconds // 86400)} d ago"
+
+def format_reading(wdata):
+    """Display strings (keyed by app property name) for a reading built by build_reading."""
+    view = {}
+    temp = wdata.get('temp')
+    if temp is None:
+        view["temp_display"] = "--°C"
+    else:
+        try:
+            view["temp_display"] = f"{float(temp):.0f}°C"
+        except Exception:
+            view["temp_display"] = f"{temp}°C"
+
+    view["condition_display"] = wdata.get("condition", "—")
+    city = wdata.get('city','')
+    region = wdata.get('region','')
+    view["location_display"] = f"{city} {region}".strip()
+    fetched_at = wdata.get("fetched_at") or time.time()
+    if wdata.get("snapshot"):
+        # restored at startup: say how old it is until the live refresh replaces it
+        view["updated_display"] = f"Saved {_age_text(time.time() - fetched_at)} · refreshing…"
+    else:
+        view["updated_display"] = f"Updated {time.strftime('%H:%M:%S', time.localtime(fetched_at))}"
+
+    aqi_val = wdata.get("aqi")
+    if aqi_val is not None:
+        view["aqi_display"] = str(aqi_val)
+        view["aqi_category"], view["aqi_message"], view["aqi_color"] = aqi_category_and_color(aqi_val)
+        if wdata.get("aqi_estimated"):
+            view["aqi_category"] += " (estimated)"
+            view["aqi_message"] = "Estimated from PM2.5/PM10. " + view["aqi_message"]
+    else:
+        view["aqi_display"] = "--"
+        view["aqi_category"] = "No AQI"
+        view["aqi_message"] = "Data unavailable"
+        view["aqi_color"] = [1,1,1,1]
+
+    view["pm25_display"] = _format_number(wdata.get("pm2_5"), "{:.1f}", " µg/m³", "-- µg/m³")
+    view["pm10_display"] = _format_number(wdata.get("pm10"), "{:.1f}", " µg/m³", "-- µg/m³")
+    view["main_pollutant"] = wdata.get("main_pollutant") or "--"
+
+    humidity = wdata.get('humidity')
+    try:
+        if humidity is None or humidity == "--":
+            view["humidity_display"] = "--%"
+        else:
+            view["humidity_display"] = f"{min(max(int(float(humidity)), 0), 100)}%"
+    except Exception:
+        view["humidity_display"] = f"{humidity}%"
+    view["wind_display"] = _format_number(wdata.get('wind'), "{:.1f}", " m/s", "-- m/s")
+    pressure = wdata.get('pressure')
+    try:
+        if pressure is None or pressure == "--":
+            view["pressure_display"] = "-- hPa"
+        else:
+            view["pressure_display"] = f"{int(float(pressure))} hPa"
+    except Exception:
+        view["pressure_display"] = str(pressure)
+
+    view["weather_icon"] = weather_icon_for(view["condition_display"], aqi_val)
+    return view
+
+class ReadingViewModel:
+    """Remembers the last rendered display values and hands back only the ones that changed.
+
+    Assigning an unchanged Kivy property still re-renders label textures and triggers a
+    layout pass, so the apps only touch what diff() returns. `fields` limits the view to
+    the properties an app actually has.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = set(fields) if fields is not None else None
+        self._last = {}
+        self.applied = 0
+        self.skipped = 0
+
+    def diff(self, view):
+        changed = {}
+        for name, value in view.items():
+            if self.fields is not None and name not in self.fields:
+                continue
+            if name in self._last and self._last[name] == value:
+                self.skipped += 1
+                continue
+            changed[name] = value
+        self.applied += len(changed)
+        self._last.update(changed)
+        return changed
+
+    def stats(self):
+        return {"applied": self.applied, "skipped": self.skipped}
+
+# ---------- Forecast ----------
+def parse_forecast(j):
+    """Column arrays for the 40 three-hour slots of an OWM /forecast response, plus its UTC offset."""
+    from array import array
+    hours = {"ts": array("q"), "temp": array("d"), "temp_min": array("d"), "temp_max": array("d"),
+             "pop": array("d"), "precip": array("d"), "condition": []}
+    for slot in j.get("list") or []:
+        try:
+            main = slot["main"]
+            ts, temp = int(slot["dt"]), float(main["temp"])
+        except Exception:
+            continue
+        hours["ts"].append(ts)
+        hours["temp"].append(temp)
+        hours["temp_min"].append(float(main.get("temp_min", temp)))
+        hours["temp_max"].append(float(main.get("temp_max", temp)))
+        hours["pop"].append(float(slot.get("pop") or 0.0))
+        hours["precip"].append(float((slot.get("rain") or {}).get("3h", 0.0)) +
+                               float((slot.get("snow") or {}).get("3h", 0.0)))
+        hours["condition"].append(((slot.get("weather") or [{}])[0].get("description") or "").title())
+    return hours, int((j.get("city") or {}).get("timezone") or 0)
+
+def aggregate_daily(hours, tz_offset=0):
+    """Per local day: min / max / mean temperature, precipitation total and max chance of rain.
+
+    Slots are in time order, so each day is one contiguous run; with NumPy every column
+    is reduced in one reduceat pass, without it each run is reduced over array slices.
+    """
+    n = len(hours["ts"])
+    if not n:
+        return []
+    np = _optional_module("numpy")
+    if np is not None:
+        day = (np.frombuffer(hours["ts"], dtype=np.int64) + tz_offset) // 86400
+        starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+        counts = np.diff(np.r_[starts, n])
+        col = {k: np.frombuffer(hours[k], dtype=np.float64) for k in ("temp", "temp_min", "temp_max", "pop", "precip")}
+        columns = zip(day[starts].tolist(), starts.tolist(), (starts + counts).tolist(),
+                      np.minimum.reduceat(col["temp_min"], starts).tolist(),
+                      np.maximum.reduceat(col["temp_max"], starts).tolist(),
+                      (np.add.reduceat(col["temp"], starts) / counts).tolist(),
+                      np.add.reduceat(col["precip"], starts).tolist(),
+                      np.maximum.reduceat(col["pop"], starts).tolist())
+    else:
+        day = [(t + tz_offset) // 86400 for t in hours["ts"]]
+        runs = [i for i in range(n) if i == 0 or day[i] != day[i - 1]] + [n]
+        columns = ((day[a], a, b, min(hours["temp_min"][a:b]), max(hours["temp_max"][a:b]),
+                    sum(hours["temp"][a:b]) / (b - a), sum(hours["precip"][a:b]), max(hours["pop"][a:b]))
+                   for a, b in zip(runs, runs[1:]))
+    days = []
+    for d, a, b, t_min, t_max, t_mean, precip, pop in columns:
+        conditions = hours["condition"][a:b]
+        days.append({"day": d * 86400, "min": t_min, "max": t_max, "mean": t_mean, "precip": precip,
+                     "pop": pop, "condition": max(set(conditions), key=conditions.count)})
+    return days
+
+def build_forecast(j):
+    hours, tz_offset = parse_forecast(j)
+    return {"city": (j.get("city") or {}).get("name", ""), "tz": tz_offset, "hours": hours,
+            "days": aggregate_daily(hours, tz_offset), "issued_at": observed_at("forecast", j)}
+
+def fetch_forecast(lat, lon, api_key):
+    """5-day / 3-hour forecast, parsed and aggregated; cached per cell until the next forecast issue."""
+    cached = response_cache.get("forecast", lat, lon)
+    if cached is not None:
+        return cached
+    try:
+        j = _provider_get("owm", api_key, _forecast_url(lat, lon, api_key))
+    except RateLimited:
+        stale = _stale_response("forecast", lat, lon)
+        if stale is None:
+            raise
+        return stale
+    forecast = build_forecast(j)
+    _cache_response("forecast", lat, lon, forecast, j)
+    return forecast
+
+def fetch_forecasts(locations, api_key):
+    """fetch_forecast for many (lat, lon) pairs in parallel on the provider pool; None where it failed."""
+    futures = [provider_pool().submit(fetch_forecast, lat, lon, api_key) for lat, lon in locations]
+    return [None if isinstance(r, BaseException) else r for r in map(_result_or_exc, futures)]
+
+def format_forecast(forecast):
+    """(daily rows, hourly rows) of display strings for the forecast screen's RecycleViews."""
+    tz = forecast["tz"]
+    days = [{"day_text": time.strftime("%a %d", time.gmtime(d["day"])),
+             "icon_text": weather_icon_for(d["condition"]),
+             "range_text": f"{d['min']:.0f}° / {d['max']:.0f}°",
+             "mean_text": f"avg {d['mean']:.0f}°",
+             "precip_text": f"{d['precip']:.1f} mm · {d['pop'] * 100:.0f}%"}
+            for d in forecast["days"]]
+    h = forecast["hours"]
+    hours = [{"time_text": time.strftime("%a %H:%M", time.gmtime(h["ts"][i] + tz)),
+              "icon_text": weather_icon_for(h["condition"][i]),
+              "temp_text": f"{h['temp'][i]:.0f}°C",
+              "pop_text": f"{h['pop'][i] * 100:.0f}%"}
+             for i in range(len(h["ts"]))]
+    return days, hours
+
+# ---------- Batched weather (OWM group) ----------
+class CityIdCache:
+    """OWM city ID per geohash cell, learned from /weather responses and kept in SQLite.
+
+    The `group` endpoint only takes city IDs, so a place can be batched once a single
+    call for it has told us its ID. Shares the geocode cache's database file.
+    """
+
+    def __init__(self, path, precision=SPATIAL_CACHE_PRECISION):
+        self.path = path
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._db = None
+        self._loaded = False
+
+    def _load_locked(self):
+        self._loaded = True
+        try:
+            import sqlite3
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS owm_city (cell TEXT PRIMARY KEY, id INTEGER)")
+            self._db.commit()
+            self._ids.update(self._db.execute("SELECT cell, id FROM owm_city").fetchall())
+        except Exception:
+            self._db = None
+
+    def _cell(self, lat, lon):
+        return geohash(float(lat), float(lon), self.precision)
+
+    def get(self, lat, lon):
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            return self._ids.get(self._cell(lat, lon))
+
+    def put(self, lat, lon, city_id):
+        if not city_id:
+            return  # OWM answers id 0 for places without a city
+        cell = self._cell(lat, lon)
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            if self._ids.get(cell) == city_id:
+                return
+            self._ids[cell] = city_id
+            if self._db is not None:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO owm_city VALUES (?, ?)", (cell, city_id))
+                    self._db.commit()
+                except Exception:
+                    pass
+
+city_ids = CityIdCache(GEOCODE_CACHE_PATH)
+
+class WeatherBatcher:
+    """Coalesces weather lookups into OWM `group` calls of up to OWM_GROUP_MAX city IDs.
+
+    submit() returns a Future of the same JSON fetch_weather returns. Lookups with a
+    known city ID wait WEATHER_BATCH_WINDOW for company (or until a group is full) and
+    are answered from one group call; cached places resolve at once, and places without
+    an ID, or missing from the group answer, fall back to an individual fetch_weather.
+    """
+
+    def __init__(self, window=WEATHER_BATCH_WINDOW, max_ids=OWM_GROUP_MAX):
+        self.window = window
+        self.max_ids = max_ids
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()  # (api_key, city_id) -> [(lat, lon, future), ...]
+        self._timer = None
+        self._stats = {"group_calls": 0, "grouped": 0, "single_calls": 0}
+
+    def submit(self, lat, lon, api_key):
+        from concurrent.futures import Future
+        fut = Future()
+        cached = response_cache.get("weather", lat, lon)
+        if cached is not None:
+            fut.set_result(cached)
+            return fut
+        city_id = city_ids.get(lat, lon)
+        if city_id is None:
+            with self._lock:
+                self._stats["single_calls"] += 1
+            return provider_pool().submit(fetch_weather, lat, lon, api_key)
+        with self._lock:
+            self._pending.setdefault((api_key, city_id), []).append((lat, lon, fut))
+            if sum(1 for k in self._pending if k[0] == api_key) >= self.max_ids:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return fut
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        groups = {}
+        for (api_key, city_id), waiters in self._pending.items():
+            groups.setdefault(api_key, []).append((city_id, waiters))
+        self._pending.clear()
+        for api_key, chunk in groups.items():
+            for i in range(0, len(chunk), self.max_ids):
+                provider_pool().submit(self._run_group, api_key, chunk[i:i + self.max_ids])
+
+    def _run_group(self, api_key, chunk):
+        try:
+            j = _provider_get("owm", api_key, _group_url([city_id for city_id, _ in chunk], api_key))
+            by_id = {item.get("id"): item for item in j.get("list") or []}
+            with self._lock:
+                self._stats["group_calls"] += 1
+        except Exception:
+            by_id = {}  # over quota or failed: every waiter takes the single-call path
+        for city_id, waiters in chunk:
+            item = by_id.get(city_id)
+            for lat, lon, fut in waiters:
+                if item is not None:
+                    _cache_response("weather", lat, lon, item, item)
+                    with self._lock:
+                        self._stats["grouped"] += 1
+                    fut.set_result(item)
+                    continue
+                with self._lock:
+                    self._stats["single_calls"] += 1
+                try:
+                    fut.set_result(fetch_weather(lat, lon, api_key))
+                except Exception as e:
+                    fut.set_exception(e)
+
+    def stats(self):
+        """Group calls made, lookups they answered, and lookups that needed an individual call."""
+        with self._lock:
+            return dict(self._stats)
+
+weather_batcher = WeatherBatcher()
+
+# ---------- Location service ----------
+def distance_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres (haversine)."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp_ = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    h = math.sin(dp_ / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371000.0 * math.asin(min(1.0, math.sqrt(h)))
+
+def _local_route_address():
+    """Address of the interface used for outbound traffic; changes when the network (and so
+    usually the public IP) changes. A UDP connect() sends no packets."""
+    import socket
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(("8.8.8.8", 80))
+            return sock.getsockname()[0]
+    except Exception:
+        return None
+
+class LocationService:
+    """Keeps the last location fix (with timestamp and accuracy) and only re-acquires it when stale.
+
+    A new fix that lies within the movement threshold of the previous one keeps the previous
+    coordinates and place names, so GPS jitter doesn't change the refresh target. The ipinfo
+    result is cached until the local network address changes or IP_LOCATION_TTL runs out.
+
+    With subscribe(), GPS runs continuously and every fix is pushed in through note_fix();
+    wait_for_fix() / wait_for_fix_async() wake up the moment the next fix lands, and
+    last_fix() is the non-blocking read.
+    """
+
+    def __init__(self, max_age=LOCATION_MAX_AGE, move_threshold=LOCATION_MOVE_THRESHOLD, ip_ttl=IP_LOCATION_TTL):
+        self.max_age = max_age
+        self.move_threshold = move_threshold
+        self.ip_ttl = ip_ttl
+        self._lock = threading.Lock()
+        self._fix_arrived = threading.Condition(self._lock)
+        self._fix_seq = 0
+        self._async_waiters = []  # (loop, future) pairs resolved on the next fix
+        self._subscribed = False
+        self._fix = None  # dict: lat, lon, city, region, country, accuracy, ts, source
+        self._ip = None   # (network key, fetched_at, fetch_ip_location() result)
+
+    def last_fix(self):
+        with self._lock:
+            return dict(self._fix) if self._fix else None
+
+    def note_fix(self, lat, lon, accuracy=None, source="gps", city=None, region=None, country=None):
+        with self._lock:
+            fix = self._note_fix_locked(lat, lon, accuracy, source, city, region, country)
+            self._fix_seq += 1
+            self._fix_arrived.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_resolve_future, fut, dict(fix))
+        return fix
+
+    def _note_fix_locked(self, lat, lon, accuracy, source, city, region, country):
+        prev = self._fix
+        now = time.time()
+        if prev is not None:
+            radius = max(self.move_threshold, accuracy or 0, prev["accuracy"] or 0)
+            if distance_m(prev["lat"], prev["lon"], lat, lon) <= radius:
+                prev["ts"] = now
+                # same place: keep the names, but take the coordinates of a sharper fix
+                if accuracy is not None and (prev["accuracy"] is None or accuracy < prev["accuracy"]):
+                    prev.update(lat=lat, lon=lon, accuracy=accuracy, source=source)
+                return dict(prev)
+        self._fix = {"lat": lat, "lon": lon, "city": city, "region": region, "country": country,
+                     "accuracy": accuracy, "ts": now, "source": source}
+        return dict(self._fix)
+
+    def _fresh_fix(self):
+        fix = self.last_fix()
+        if fix is not None and time.time() - fix["ts"] < self.max_age:
+            return fix
+        return None
+
+    # -- continuous GPS subscription --
+    def subscribe(self):
+        """Start the long-lived GPS subscription (no-op without plyer GPS or when already running)."""
+        gps = _gps()
+        if gps is None:
+            return False
+        with self._lock:
+            if self._subscribed:
+                return True
+            self._subscribed = True
+        try:
+            gps.configure(on_location=self._on_gps_location, on_status=lambda *args, **kwargs: None)
+            gps.start(minTime=GPS_MIN_TIME_MS, minDistance=0)
+        except Exception:
+            with self._lock:
+                self._subscribed = False
+        return self._subscribed
+
+    def unsubscribe(self):
+        with self._lock:
+            if not self._subscribed:
+                return
+            self._subscribed = False
+        try:
+            _gps().stop()
+        except Exception:
+            pass
+
+    def _on_gps_location(self, **kwargs):
+        try:
+            lat, lon = float(kwargs.get("lat")), float(kwargs.get("lon"))
+        except Exception:
+            return
+        self.note_fix(lat, lon, kwargs.get("accuracy"))
+
+    def wait_for_fix(self, timeout):
+        """Block until the next fix arrives (or timeout); returns it, or None."""
+        with self._lock:
+            seq = self._fix_seq
+            if not self._fix_arrived.wait_for(lambda: self._fix_seq != seq, timeout):
+                return None
+            return dict(self._fix)
+
+    async def wait_for_fix_async(self, timeout):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._lock:
+            self._async_waiters.append((loop, fut))
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                if (loop, fut) in self._async_waiters:
+                    self._async_waiters.remove((loop, fut))
+
+    def locate(self, timeout=None):
+        """(lat, lon, city, region, country) like determine_location used to return, or None.
+
+        With a timeout (seconds) GPS gets half of it and ipinfo the rest; a lookup that takes
+        longer is abandoned (the ipinfo call still fills its cache) and the last fix is used
+        even if stale. With no last fix to fall back on (cold start) ipinfo is waited for.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        fix = self._fresh_fix()
+        if fix is None and self._subscribed:
+            fix = self.wait_for_fix(GPS_FIX_TIMEOUT if deadline is None else min(GPS_FIX_TIMEOUT, timeout / 2))
+        if fix is not None:
+            return self._as_tuple(fix)
+        fallback = self._last_known() if deadline is not None else None
+        if fallback is None:
+            return self._locate_ip()
+        from concurrent.futures import TimeoutError as FutureTimeout
+        try:
+            return provider_pool().submit(self._locate_ip).result(max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            return fallback
+
+    async def locate_async(self, timeout=None):
+        import asyncio
+        deadline = None if timeout is None else time.monotonic() + timeout
+        fix = self._fresh_fix()
+        if fix is None and self._subscribed:
+            fix = await self.wait_for_fix_async(GPS_FIX_TIMEOUT if deadline is None else min(GPS_FIX_TIMEOUT, timeout / 2))
+        if fix is not None:
+            return self._as_tuple(fix)
+        ip = asyncio.get_running_loop().run_in_executor(provider_pool(), self._locate_ip)
+        fallback = self._last_known() if deadline is not None else None
+        if fallback is None:
+            return await ip
+        try:
+            return await asyncio.wait_for(asyncio.shield(ip), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            return fallback
+
+    def _last_known(self):
+        fix = self.last_fix()
+        return self._as_tuple(fix) if fix is not None else None
+
+    def _locate_ip(self):
+        loc = self.ip_location()
+        if loc is None:
+            return None
+        lat, lon, city, region, country = loc
+        return self._as_tuple(self.note_fix(lat, lon, IP_FIX_ACCURACY, "ip", city, region, country))
+
+    def ip_location(self):
+        network = _local_route_address()
+        with self._lock:
+            if self._ip is not None and self._ip[0] == network and time.time() - self._ip[1] < self.ip_ttl:
+                return self._ip[2]
+        loc = fetch_ip_location()
+        if loc is not None:
+            with self._lock:
+                self._ip = (network, time.time(), loc)
+        return loc
+
+    @staticmethod
+    def _as_tuple(fix):
+        return fix["lat"], fix["lon"], fix["city"], fix["region"], fix["country"]
+
+location_service = LocationService()
+
+def _resolve_future(fut, value):
+    if not fut.done():
+        fut.set_result(value)
+
+# ---------- Concurrent provider fan-out ----------
+_provider_pool = None
+_provider_pool_lock = threading.Lock()
+
+def provider_pool():
+    """Shared executor for the provider fan-out (created on first use)."""
+    global _provider_pool
+    if _provider_pool is None:
+        with _provider_pool_lock:
+            if _provider_pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _provider_pool = ThreadPoolExecutor(max_workers=PROVIDER_WORKERS, thread_name_prefix="provider")
+    return _provider_pool
+
+# per-provider field extractors; each returns {} for a missing result or an exception
+def _weather_fields(wjson):
+    try:
+        return {"temp": wjson["main"]["temp"],
+                "condition": wjson["weather"][0]["description"].title(),
+                "humidity": wjson["main"].get("humidity"),
+                "wind": wjson.get("wind", {}).get("speed"),
+                "pressure": wjson["main"].get("pressure")}
+    except Exception:
+        return {}
+
+def _aqi_fields(aqi_result):
+    if isinstance(aqi_result, BaseException) or not aqi_result or aqi_result[0] is None:
+        return {}
+    return {"aqi": aqi_result[0], "main_pollutant": aqi_result[1], "aqi_estimated": False}
+
+def _pollution_fields(comps):
+    if isinstance(comps, BaseException) or not comps:
+        return {}
+    return {"pm2_5": comps.get("pm2_5"), "pm10": comps.get("pm10")}
+
+def _merge_provider_results(wjson, aqi_result, comps):
+    """Merge raw provider results into one flat dict; exceptions count as missing data."""
+    merged = {"temp": None, "condition": "Weather error", "humidity": None,
+              "wind": None, "pressure": None, "aqi": None, "main_pollutant": "",
+              "pm2_5": None, "pm10": None}
+    merged.update(_weather_fields(wjson))
+    merged.update(_aqi_fields(aqi_result))
+    merged.update(_pollution_fields(comps))
+    if merged["aqi"] is None:
+        # no IQAir answer (late, failed or no key): estimate from the OWM components
+        merged["aqi"], main = estimate_aqi(merged["pm2_5"], merged["pm10"])
+        if merged["aqi"] is not None:
+            merged["main_pollutant"] = main
+            merged["aqi_estimated"] = True
+    return merged
+
+def _merge_late_weather(wjson, aqi_result, comps):
+    # wjson None: the weather call missed the deadline with nothing cached to stand in for it
+    merged = _merge_provider_results(wjson, aqi_result, comps)
+    if wjson is None:
+        merged["condition"] = "Updating…"
+        merged["weather_pending"] = True
+    return merged
+
+def _result_or_exc(future):
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+def _report_partial(on_partial, extract, result):
+    fields = extract(result)
+    if fields:
+        try:
+            on_partial(fields)
+        except Exception:
+            pass
+
+def fetch_providers(lat, lon, budget=None, on_partial=None, batched=False):
+    """Run the weather, IQAir and OWM pollution calls in parallel and merge their fields.
+
+    With a `budget` (seconds) slow providers are not waited for: IQAir gets
+    IQAIR_BUDGET_SHARE of it before the AQI is estimated from pm2_5/pm10, pollution the
+    whole budget, and a late weather call is replaced by its last cached response if there
+    is one; without one the result comes back with empty weather fields and
+    weather_pending=True. Late calls keep running, report through on_partial when they
+    land and fill the cache for the next refresh.
+
+    `on_partial(fields)` is called (on a provider thread) with each provider's fields as
+    soon as that call returns, before the merged result is ready. batched=True routes the
+    weather call through weather_batcher, for callers running many locations at once.
+    """
+    pool = provider_pool()
+    if batched:
+        f_weather = weather_batcher.submit(lat, lon, OWM_API_KEY)
+    else:
+        f_weather = pool.submit(fetch_weather, lat, lon, OWM_API_KEY)
+    f_aqi = pool.submit(fetch_aqi_iqair, lat, lon, IQAIR_API_KEY)
+    f_poll = pool.submit(fetch_openweather_pollution, lat, lon, OWM_API_KEY)
+    if on_partial is not None:
+        for f, extract in ((f_weather, _weather_fields), (f_aqi, _aqi_fields), (f_poll, _pollution_fields)):
+            f.add_done_callback(lambda f, extract=extract: _report_partial(on_partial, extract, _result_or_exc(f)))
+    if budget is None:
+        return _merge_provider_results(_result_or_exc(f_weather), _result_or_exc(f_aqi), _result_or_exc(f_poll))
+    from concurrent.futures import wait
+    start = time.monotonic()
+    wait([f_aqi], timeout=budget * IQAIR_BUDGET_SHARE)
+    wait([f_weather, f_poll], timeout=max(0.0, start + budget - time.monotonic()))
+    aqi_result = _result_or_exc(f_aqi) if f_aqi.done() else None
+    comps = _result_or_exc(f_poll) if f_poll.done() else response_cache.stale("pollution", lat, lon)
+    wjson = _result_or_exc(f_weather) if f_weather.done() else response_cache.stale("weather", lat, lon)
+    return _merge_late_weather(wjson, aqi_result, comps)
+
+def fetch_readings(locations, iqair=False):
+    """Merged provider results for many (lat, lon) pairs; all their calls go out together on the provider pool.
+
+    Weather goes through weather_batcher, so places with a known OWM city ID share group calls.
+
+    IQAir is skipped by default (its quota can't cover many sites); the AQI is then
+    estimated from the OWM components.
+    """
+    pool = provider_pool()
+    futures = []
+    for lat, lon in locations:
+        futures.append((weather_batcher.submit(lat, lon, OWM_API_KEY),
+                        pool.submit(fetch_aqi_iqair, lat, lon, IQAIR_API_KEY) if iqair else None,
+                        pool.submit(fetch_openweather_pollution, lat, lon, OWM_API_KEY)))
+    return [_merge_provider_results(_result_or_exc(f_weather), _result_or_exc(f_aqi) if f_aqi else None,
+                                    _result_or_exc(f_poll))
+            for f_weather, f_aqi, f_poll in futures]
+
+def build_reading(r, city=None, region=None, lat=None, lon=None):
+    """The flat `data` dict that update_all stores in _last_fetch and renders."""
+    return {
+        "lat": lat,
+        "lon": lon,
+        "aqi_estimated": r.get("aqi_estimated", False),
+        "weather_pending": r.get("weather_pending", False),
+        "temp": r["temp"],
+        "condition": r["condition"],
+        "city": city or "",
+        "region": region or "",
+        "country": "",
+        "aqi": r["aqi"],
+        "main_pollutant": r["main_pollutant"] or "--",
+        "pm2_5": r["pm2_5"],
+        "pm10": r["pm10"],
+        "humidity": r["humidity"] if r["humidity"] is not None else "--",
+        "wind": r["wind"] if r["wind"] is not None else "--",
+        "pressure": r["pressure"] if r["pressure"] is not None else "--",
+        "fetched_at": time.time(),
+    }
+
+_WEATHER_KEYS = ("temp", "condition", "humidity", "wind", "pressure")
+
+def keep_shown_weather(shown, reading):
+    """`reading` to put on screen over `shown`: while its weather is still pending for the same
+    place, the weather already shown stays and only the fields that arrived replace theirs."""
+    if not reading or not reading.get("weather_pending") or not shown or shown.get("temp") is None:
+        return reading
+    if (shown.get("lat"), shown.get("lon")) != (reading.get("lat"), reading.get("lon")):
+        return reading
+    return dict(reading, **{k: shown[k] for k in _WEATHER_KEYS if k in shown})
+
+# ---------- Reading snapshot ----------
+def save_snapshot(reading, path=SNAPSHOT_PATH):
+    """Atomically replace the cold-start snapshot with `reading`; False if it couldn't be written."""
+    return write_json_atomic(path, reading)
+
+def write_json_atomic(path, obj):
+    """Write obj as JSON to path via a temp file + os.replace; False if it couldn't be written."""
+    import json, tempfile
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path) or ".")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)  # readers see the old or the new file, never a partial one
+        return True
+    except Exception:
+        if tmp is not None:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+        return False
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """Last saved reading, flagged with "snapshot": True, or None if there is no usable one."""
+    import json
+    try:
+        with open(path, encoding="utf-8") as f:
+            reading = json.load(f)
+    except Exception:
+        return None
+    if not isinstance(reading, dict) or reading.get("temp") is None:
+        return None
+    reading["snapshot"] = True
+    return reading
+
+# ---------- asyncio provider engine ----------
+class AsyncEngine:
+    """Dedicated asyncio loop thread that runs provider coroutines alongside Kivy's own loop.
+
+    Coroutines are scheduled with submit(), which returns a concurrent.futures.Future
+    the caller can wait on, cancel(), or give a deadline via `timeout`.
+
+    HTTP goes through aiohttp when it is installed (optional dependency), so any number of
+    lookups can be in flight on the one loop thread. Without it get_json falls back to the
+    pooled requests session on the provider pool, which caps the engine at
+    PROVIDER_WORKERS (default 6) concurrent calls.
+    """
+
+    def __init__(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self._session = None
+        self._thread = threading.Thread(target=self._run, name="async-engine", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        import asyncio
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro, timeout=None):
+        import asyncio
+        if timeout is not None:
+            coro = asyncio.wait_for(coro, timeout)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def get_json(self, url, timeout=8, limit=None):
+        """GET url and decode JSON; uses aiohttp when installed, else the pooled session on a
+        provider-pool worker (at most PROVIDER_WORKERS calls at once).
+
+        With limit=(provider, key) the call is counted against that quota and a 429 raises
+        RateLimited (see _provider_get).
+        """
+        if limit is not None and not rate_limiter.acquire(*limit):
+            raise RateLimited(f"{limit[0]} quota used up")
+        aiohttp = _optional_module("aiohttp")
+        if aiohttp is not None:
+            if self._session is None:
+                connector = aiohttp.TCPConnector(limit_per_host=HTTP_POOL_SIZE)
+                self._session = aiohttp.ClientSession(connector=connector)
+            async with self._session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+                if r.status == 429 and limit is not None:
+                    raise rate_limiter.throttled(*limit, r.headers.get("Retry-After"))
+                r.raise_for_status()
+                return await r.json(content_type=None)
+
+        def _get():
+            r = get_http().get(url, timeout=timeout)
+            if r.status_code == 429 and limit is not None:
+                raise rate_limiter.throttled(*limit, r.headers.get("Retry-After"))
+            r.raise_for_status()
+            return r.json()
+        return await self.loop.run_in_executor(provider_pool(), _get)
+
+    async def _close(self):
+        import asyncio
+        tasks = [t for t in asyncio.all_tasks(self.loop) if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def close(self):
+        import asyncio
+        try:
+            asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(timeout=2)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncEngine()
+        return _engine
+
+def shutdown_engine():
+    global _engine
+    with _engine_lock:
+        engine, _engine = _engine, None
+    if engine is not None:
+        engine.close()
+
+async def fetch_ip_location_async():
+    try:
+        return _parse_ip_location(await get_engine().get_json(IPINFO_URL, timeout=6))
+    except Exception:
+        return None
+
+async def owm_geocode_city_async(city_name, api_key):
+    cached = geocode_cache.get(city_name)
+    if cached is not GeocodeCache.MISS:
+        return cached
+    try:
+        res = _parse_geocode(await get_engine().get_json(_geocode_url(city_name, api_key), limit=("owm", api_key)))
+    except RateLimited:
+        raise
+    except Exception:
+        return None
+    geocode_cache.put(city_name, res)
+    return res
+
+async def fetch_weather_async(lat, lon, api_key):
+    cached = response_cache.get("weather", lat, lon)
+    if cached is not None:
+        return cached
+    try:
+        j = await get_engine().get_json(_weather_url(lat, lon, api_key), limit=("owm", api_key))
+    except RateLimited:
+        stale = _stale_response("weather", lat, lon)
+        if stale is None:
+            raise
+        return stale
+    _cache_response("weather", lat, lon, j, j)
+    city_ids.put(lat, lon, j.get("id"))
+    return j
+
+async def fetch_openweather_pollution_async(lat, lon, api_key):
+    cached = response_cache.get("pollution", lat, lon)
+    if cached is not None:
+        return cached
+    try:
+        j = await get_engine().get_json(_pollution_url(lat, lon, api_key), limit=("owm", api_key))
+        comps = _parse_pollution(j)
+    except RateLimited:
+        return _stale_response("pollution", lat, lon)
+    except Exception:
+        return None
+    if comps:
+        _cache_response("pollution", lat, lon, comps, j)
+    return comps
+
+async def fetch_aqi_iqair_async(lat, lon, key):
+    cached = response_cache.get("iqair", lat, lon)
+    if cached is not None:
+        return cached
+    try:
+        j = await get_engine().get_json(_iqair_url(lat, lon, key), limit=("iqair", key))
+        res = _parse_iqair(j)
+    except RateLimited:
+        return _stale_response("iqair", lat, lon) or (None, "")
+    except Exception:
+        return (None, "")
+    if res[0] is not None:
+        _cache_response("iqair", lat, lon, res, j)
+    return res
+
+def _task_result_or_exc(task):
+    return task.exception() or task.result()
+
+async def fetch_providers_async(lat, lon, budget=None, on_partial=None):
+    """Coroutine version of fetch_providers; the three calls share one event loop, not three threads."""
+    import asyncio
+    if on_partial is not None:
+        async def reporting(coro, extract):
+            try:
+                result = await coro
+            except Exception as e:
+                result = e
+            _report_partial(on_partial, extract, result)
+            if isinstance(result, BaseException):
+                raise result
+            return result
+        weather_coro = reporting(fetch_weather_async(lat, lon, OWM_API_KEY), _weather_fields)
+        aqi_coro = reporting(fetch_aqi_iqair_async(lat, lon, IQAIR_API_KEY), _aqi_fields)
+        poll_coro = reporting(fetch_openweather_pollution_async(lat, lon, OWM_API_KEY), _pollution_fields)
+    else:
+        weather_coro = fetch_weather_async(lat, lon, OWM_API_KEY)
+        aqi_coro = fetch_aqi_iqair_async(lat, lon, IQAIR_API_KEY)
+        poll_coro = fetch_openweather_pollution_async(lat, lon, OWM_API_KEY)
+    if budget is None:
+        wjson, aqi_result, comps = await asyncio.gather(weather_coro, aqi_coro, poll_coro, return_exceptions=True)
+        return _merge_provider_results(wjson, aqi_result, comps)
+    loop = asyncio.get_running_loop()
+    t_weather = asyncio.ensure_future(weather_coro)
+    t_aqi = asyncio.ensure_future(aqi_coro)
+    t_poll = asyncio.ensure_future(poll_coro)
+    for t in (t_weather, t_aqi, t_poll):
+        # late tasks finish unobserved; retrieve their exceptions so asyncio doesn't log them
+        t.add_done_callback(lambda t: t.cancelled() or t.exception())
+    start = loop.time()
+    await asyncio.wait([t_aqi], timeout=budget * IQAIR_BUDGET_SHARE)
+    await asyncio.wait([t_weather, t_poll], timeout=max(0.0, start + budget - loop.time()))
+    aqi_result = _task_result_or_exc(t_aqi) if t_aqi.done() else None
+    comps = _task_result_or_exc(t_poll) if t_poll.done() else response_cache.stale("pollution", lat, lon)
+    wjson = _task_result_or_exc(t_weather) if t_weather.done() else response_cache.stale("weather", lat, lon)
+    return _merge_late_weather(wjson, aqi_result, comps)
+
+# ---------- Bounded priority worker pool ----------
+PRIORITY_USER = 0         # search / manual refresh
+PRIORITY_BACKGROUND = 10  # periodic refresh
+
+class WorkerPool:
+    """Fixed number of worker threads fed from a priority queue.
+
+    Lower priority values run first (FIFO within a priority). Submitting with a
+    `replace_key` drops any still-queued task carrying the same key, so a newer periodic
+    refresh replaces an older one that never started. stats() reports queue depth and
+    queue wait times for sizing the pool.
+    """
+
+    def __init__(self, workers, name="worker"):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._replaceable = {}  # replace_key -> queued entry
+        self._queued = 0
+        self._stats = {"submitted": 0, "completed": 0, "dropped": 0, "max_queued": 0,
+                       "wait_total": 0.0, "wait_max": 0.0}
+        self._workers = workers
+        for i in range(workers):
+            threading.Thread(target=self._loop, name=f"{name}-{i}", daemon=True).start()
+
+    def submit(self, fn, *args, priority=PRIORITY_BACKGROUND, replace_key=None, **kwargs):
+        from concurrent.futures import Future
+        fut = Future()
+        entry = [priority, next(self._seq), time.monotonic(), fut, fn, args, kwargs, replace_key]
+        with self._cond:
+            if replace_key is not None:
+                old = self._replaceable.pop(replace_key, None)
+                if old is not None:
+                    self._drop_locked(old)
+                self._replaceable[replace_key] = entry
+            heapq.heappush(self._heap, entry)
+            self._queued += 1
+            self._stats["submitted"] += 1
+            self._stats["max_queued"] = max(self._stats["max_queued"], self._queued)
+            self._cond.notify()
+        return fut
+
+    def _drop_locked(self, entry):
+        # lazy deletion: the worker skips entries whose fn was cleared
+        entry[4] = None
+        self._queued -= 1
+        self._stats["dropped"] += 1
+        entry[3].cancel()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                entry = heapq.heappop(self._heap)
+                _prio, _seq, queued_at, fut, fn, args, kwargs, replace_key = entry
+                if fn is None:
+                    continue
+                self._queued -= 1
+                if replace_key is not None and self._replaceable.get(replace_key) is entry:
+                    del self._replaceable[replace_key]
+                waited = time.monotonic() - queued_at
+                self._stats["wait_total"] += waited
+                self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+            with self._cond:
+                self._stats["completed"] += 1
+
+    def stats(self):
+        with self._cond:
+            st = dict(self._stats)
+            started = st["submitted"] - st["dropped"] - self._queued
+            st["workers"] = self._workers
+            st["queued"] = self._queued
+            st["avg_wait_ms"] = round(1000 * st.pop("wait_total") / started, 1) if started else 0.0
+            st["max_wait_ms"] = round(1000 * st.pop("wait_max"), 1)
+            return st
+
+# ---------- Single-flight refresh coordination ----------
+class SingleFlight:
+    """Coalesces overlapping refresh runs.
+
+    A run for a key that is already in flight is joined (the caller gets the same Future)
+    instead of starting a second pipeline. Every run gets a generation number and a result
+    is only published if no newer run has published before it; supersede=True cancels all
+    older runs so their results are dropped (a cancelled run that hasn't started never runs).
+    A background run requested while a user run (search, picked suggestion, manual refresh)
+    is in flight joins that run instead, so a periodic refresh can't outrank the user.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()  # keeps _last_fetch writes in generation order
+        self._inflight = {}  # key -> (generation, Future, priority)
+        self._generation = 0
+        self._published = 0
+
+    def begin(self, supersede=False):
+        """Allocate a new generation; with supersede, every older one becomes stale."""
+        with self._lock:
+            return self._begin_locked(supersede)
+
+    def _begin_locked(self, supersede):
+        self._generation += 1
+        if supersede:
+            self._published = max(self._published, self._generation - 1)
+        return self._generation
+
+    def publish(self, generation, publish, result):
+        """Hand `result` to `publish` unless a newer generation already published; returns True if it did."""
+        with self._publish_lock:
+            with self._lock:
+                if generation <= self._published:
+                    return False
+                self._published = generation
+            publish(result)
+            return True
+
+    def publish_partial(self, generation, publish, partial):
+        """Hand a partial result to `publish` unless a newer generation already published.
+
+        Partials of the generation on screen still pass: they fill in calls that missed the deadline.
+        """
+        with self._publish_lock:
+            with self._lock:
+                if generation < self._published:
+                    return False
+            publish(partial)
+            return True
+
+    def run(self, key, fn, *args, supersede=False, publish=None, priority=PRIORITY_BACKGROUND,
+            replace_key=None, progress=None, **kwargs):
+        """Run fn(*args, **kwargs) on the pool, single-flight per key.
+
+        With `progress`, fn also gets a progress= callback whose partial results reach
+        progress() through publish_partial.
+        """
+        from concurrent.futures import Future
+        with self._lock:
+            current = self._inflight.get(key)
+            if current is not None:
+                return current[1]
+            if priority >= PRIORITY_BACKGROUND and not supersede:
+                for _gen, fut, prio in self._inflight.values():
+                    if prio < PRIORITY_BACKGROUND:
+                        return fut
+            if supersede:
+                for _gen, fut, _prio in self._inflight.values():
+                    fut.cancel()
+                self._inflight.clear()
+            gen = self._begin_locked(supersede)
+            fut = Future()
+            self._inflight[key] = (gen, fut, priority)
+        if progress is not None:
+            kwargs["progress"] = lambda partial: self.publish_partial(gen, progress, partial)
+        queued = self._pool.submit(self._worker, key, gen, fut, fn, args, kwargs, publish,
+                                   priority=priority, replace_key=replace_key)
+        queued.add_done_callback(lambda q: q.cancelled() and self._dropped(key, gen, fut))
+        return fut
+
+    def _dropped(self, key, gen, fut):
+        # the pool discarded the queued run in favour of a newer one
+        self._finish(key, gen)
+        fut.cancel()
+
+    def _worker(self, key, gen, fut, fn, args, kwargs, publish):
+        from concurrent.futures import InvalidStateError
+        if fut.cancelled():
+            self._finish(key, gen)  # superseded while queued: skip the calls entirely
+            return
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._finish(key, gen)
+            try:
+                fut.set_exception(e)
+            except InvalidStateError:
+                pass  # superseded and cancelled meanwhile
+            return
+        self._finish(key, gen)
+        if publish is not None and not fut.cancelled():
+            self.publish(gen, publish, result)
+        try:
+            fut.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _finish(self, key, gen):
+        with self._lock:
+            current = self._inflight.get(key)
+            if current is not None and current[0] == gen:
+                del self._inflight[key]
+
+# ---------- Adaptive refresh scheduling ----------
+SCHEDULED_PROVIDERS = ("weather", "pollution", "iqair")
+
+class RefreshScheduler:
+    """Decides how long to wait before the next periodic refresh.
+
+    After a good reading the delay runs until the earliest predicted provider update for
+    that location, i.e. the response cache expiry that next_update_at derived from OWM `dt`
+    / IQAir `ts`; polling earlier would only return the same data. Providers often publish
+    late, so a provider whose data is already overdue is re-checked no sooner than the
+    baseline interval, and each re-check that brings back the same observation time doubles
+    that wait (up to max_delay) until the timestamp moves again. After a failed reading
+    it backs off exponentially (BACKOFF_BASE doubling up to BACKOFF_MAX) with jitter.
+    The last decisions are kept in `decisions` and summarized by stats().
+    """
+
+    def __init__(self, baseline_interval=None, min_delay=SCHEDULE_MIN_DELAY, max_delay=SCHEDULE_MAX_DELAY,
+                 jitter=SCHEDULE_JITTER, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, history=50):
+        self.baseline_interval = baseline_interval
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.decisions = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._seen = {}  # provider -> (last observation time, re-checks that returned it unchanged)
+        self._stats = {"scheduled": 0, "backoffs": 0, "overdue": 0, "total_delay": 0.0}
+
+    def next_delay(self, reading, now=None, superseded=False):
+        """Seconds until the next refresh after `reading` (None or a status dict counts as a failure).
+
+        superseded=True means the run was cancelled in favour of another one, and a reading
+        whose weather missed the deadline (weather_pending) will find it cached shortly: both
+        retry after min_delay without counting a failure.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if superseded or (reading and reading.get("weather_pending")):
+                delay = self.min_delay
+                decision = {"at": now, "delay": delay, "reason": "superseded" if superseded else "weather pending"}
+            elif not reading or reading.get("temp") is None:
+                self._failures += 1
+                cap = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+                delay = random.uniform(cap / 2, cap)
+                decision = {"at": now, "delay": delay, "reason": "backoff", "failures": self._failures}
+                self._stats["backoffs"] += 1
+            else:
+                self._failures = 0
+                lat, lon = reading.get("lat"), reading.get("lon")
+                due = {}  # provider -> seconds until its next predicted update
+                if lat is not None and lon is not None:
+                    for provider in SCHEDULED_PROVIDERS:
+                        expires = response_cache.expires_at(provider, lat, lon)
+                        if expires is not None:
+                            due[provider] = round(max(expires - now, self._overdue_wait(provider, lat, lon, now)), 1)
+                if due:
+                    provider = min(due, key=due.get)
+                    delay, reason = due[provider], f"next {provider} update"
+                else:
+                    delay, reason = self.baseline_interval or self.max_delay, "no timestamps"
+                delay = min(self.max_delay, max(self.min_delay, delay)) + random.uniform(0, self.jitter)
+                decision = {"at": now, "delay": delay, "reason": reason, "due": due}
+            self._stats["scheduled"] += 1
+            self._stats["total_delay"] += delay
+            self.decisions.append(decision)
+            return delay
+
+    def _overdue_wait(self, provider, lat, lon, now):
+        # 0 while the provider's next update is still ahead; else the backed-off re-check delay
+        observed = response_cache.observed(provider, lat, lon)
+        last, unchanged = self._seen.get(provider, (None, 0))
+        if observed is None or observed + PROVIDER_TTL.get(provider, 0) + PROVIDER_PUBLISH_LAG > now:
+            self._seen[provider] = (observed, 0)
+            return 0
+        unchanged = unchanged + 1 if observed == last else 0
+        self._seen[provider] = (observed, unchanged)
+        self._stats["overdue"] += 1
+        base = max(self.min_delay, self.baseline_interval or 0)
+        return min(self.max_delay, base * 2 ** unchanged)
+
+    def stats(self):
+        """Schedule summary plus response-cache hits (provider requests that were skipped)."""
+        with self._lock:
+            st = dict(self._stats)
+            total = st.pop("total_delay")
+            st["avg_delay_s"] = round(total / st["scheduled"], 1) if st["scheduled"] else 0.0
+            st["failures"] = self._failures
+            if self.baseline_interval:
+                # polls a fixed interval would have made over the same span
+                st["baseline_polls"] = int(total // self.baseline_interval)
+        st["cache_hits"] = response_cache.hits
+        st["cache_misses"] = response_cache.misses
+        return st
+
+# ---------- Refresh pipeline ----------
+class RefreshPipeline:
+    """The update_all pipeline both apps share: locate -> fan out providers -> build_reading.
+
+    Runs go through a bounded WorkerPool and SingleFlight. `publish(data)` receives every
+    accepted result in generation order (the apps store _last_fetch and schedule the UI
+    update there); `locate(timeout)` resolves refreshes that have no explicit target.
+    `scheduler` times the periodic refreshes (see poll()); `suggester` serves the city
+    box's type-ahead on the same pool.
+
+    `publish_partial(fields)`, if given, receives each provider's fields (plus the place:
+    lat, lon, city, region) as they arrive, including calls that land after the run's
+    deadline, until a newer run publishes.
+    Every reading built is also appended to `history` (a timeseries.TimeSeriesStore), if given.
+    """
+
+    def __init__(self, publish, workers=2, locate=None, baseline_interval=None, publish_partial=None,
+                 history=None):
+        self.publish = publish
+        self.publish_partial = publish_partial
+        self.history = history
+        self.locate = locate or location_service.locate
+        self.pool = WorkerPool(workers, name="refresh")
+        self.flight = SingleFlight(self.pool)
+        self.suggester = CitySuggester(self.pool)
+        self.scheduler = RefreshScheduler(baseline_interval)
+
+    @staticmethod
+    def _place_progress(progress, lat, lon, city, region):
+        # every partial carries the place, so a new location never shows old-place data
+        if progress is None:
+            return None
+        place = {"lat": lat, "lon": lon, "city": city or "", "region": region or ""}
+        return lambda fields: progress(dict(place, **fields))
+
+    def collect(self, lat_override=None, lon_override=None, city=None, region=None, progress=None):
+        """One reading within REFRESH_DEADLINE: locating gets LOCATE_BUDGET_SHARE of it, the providers the rest.
+
+        A cold start (no last fix) waits for the real location and still leaves the providers their share.
+        """
+        started = time.monotonic()
+        try:
+            if lat_override is None or lon_override is None:
+                loc = self.locate(REFRESH_DEADLINE * LOCATE_BUDGET_SHARE)
+                if not loc:
+                    return None
+                lat, lon, city_auto, region_auto, country_auto = loc
+                if city is None:
+                    city = city_auto or ""
+                if region is None:
+                    region = region_auto or country_auto or ""
+            else:
+                lat, lon = lat_override, lon_override
+
+            elapsed = time.monotonic() - started
+            budget = max(REFRESH_DEADLINE * (1 - LOCATE_BUDGET_SHARE), REFRESH_DEADLINE - elapsed)
+            r = fetch_providers(lat, lon, budget, self._place_progress(progress, lat, lon, city, region))
+            reading = build_reading(r, city, region, lat, lon)
+            if self.history is not None:
+                self.history.append(reading)
+            return reading
+        except Exception as e:
+            return {"condition": f"Error: {e}"}
+
+    async def collect_async(self, lat_override=None, lon_override=None, city=None, region=None, progress=None):
+        started = time.monotonic()
+        try:
+            if lat_override is None or lon_override is None:
+                loc = await location_service.locate_async(REFRESH_DEADLINE * LOCATE_BUDGET_SHARE)
+                if not loc:
+                    return None
+                lat, lon, city_auto, region_auto, country_auto = loc
+                if city is None:
+                    city = city_auto or ""
+                if region is None:
+                    region = region_auto or country_auto or ""
+            else:
+                lat, lon = lat_override, lon_override
+
+            elapsed = time.monotonic() - started
+            budget = max(REFRESH_DEADLINE * (1 - LOCATE_BUDGET_SHARE), REFRESH_DEADLINE - elapsed)
+            r = await fetch_providers_async(lat, lon, budget, self._place_progress(progress, lat, lon, city, region))
+            reading = build_reading(r, city, region, lat, lon)
+            if self.history is not None:
+                self.history.append(reading)
+            return reading
+        except Exception as e:
+            return {"condition": f"Error: {e}"}
+
+    def collect_city(self, city_text, progress=None):
+        try:
+            res = local_geocode(city_text) or owm_geocode_city(city_text, OWM_API_KEY)
+        except RateLimited:
+            return {"condition": "Search limit reached, try again in a minute"}
+        if not res:
+            return {"condition": "City not found"}
+        lat, lon, name, state, country = res
+        return self.collect(lat_override=lat, lon_override=lon, city=name, region=state or country,
+                            progress=progress)
+
+    def _progress_for(self, gen):
+        if self.publish_partial is None:
+            return None
+        return lambda partial: self.flight.publish_partial(gen, self.publish_partial, partial)
+
+    def update_all(self, lat_override=None, lon_override=None, city=None, region=None):
+        """Run the pipeline on the calling thread and publish the result; returns it."""
+        gen = self.flight.begin()
+        data = self.collect(lat_override, lon_override, city, region, self._progress_for(gen))
+        self.flight.publish(gen, self.publish, data)
+        return data
+
+    async def update_all_async(self, lat_override=None, lon_override=None, city=None, region=None):
+        gen = self.flight.begin()
+        data = await self.collect_async(lat_override, lon_override, city, region, self._progress_for(gen))
+        self.flight.publish(gen, self.publish, data)
+        return data
+
+    def request_refresh(self, supersede=False, priority=PRIORITY_BACKGROUND, **target):
+        """Single-flight update_all: requests for a target that is already being fetched join that run,
+        and a background refresh joins any user run in flight rather than outranking it."""
+        key = ("coords", target.get("lat_override"), target.get("lon_override"))
+        # a queued periodic refresh that hasn't started yet is dropped in favour of a newer one
+        replace_key = "periodic" if priority == PRIORITY_BACKGROUND else None
+        return self.flight.run(key, self.collect, supersede=supersede, publish=self.publish,
+                               priority=priority, replace_key=replace_key, progress=self.publish_partial, **target)
+
+    def poll(self, reschedule):
+        """Periodic refresh: request_refresh, then reschedule(delay) with the scheduler's next delay."""
+        def done(fut):
+            if fut.cancelled():
+                reschedule(self.scheduler.next_delay(None, superseded=True))
+                return
+            reading = fut.result() if fut.exception() is None else None
+            reschedule(self.scheduler.next_delay(reading))
+        fut = self.request_refresh()
+        fut.add_done_callback(done)
+        return fut
+
+    def request_forecast(self, lat, lon, priority=PRIORITY_USER):
+        """Fetch + format the forecast on the refresh pool (never the UI thread); Future of format_forecast rows."""
+        return self.pool.submit(lambda: format_forecast(fetch_forecast(lat, lon, OWM_API_KEY)),
+                                priority=priority, replace_key="forecast")
+
+    def search(self, city_text):
+        # a newer search supersedes (and cancels) any older run still in flight
+        return self.flight.run(("search", city_text.lower()), self.collect_city, city_text,
+                               supersede=True, publish=self.publish, priority=PRIORITY_USER,
+                               progress=self.publish_partial)
+
+    def start_refresh(self, timeout=None, **target):
+        """Schedule update_all_async on the engine loop; returns a Future (result() / cancel())."""
+        return get_engine().submit(self.update_all_async(**target), timeout=timeout)
+
+# ---------- City suggestions ----------
+def suggestion_label(place):
+    """Dropdown text for a (lat, lon, name, region, country) suggestion, e.g. "Portland, Maine, US"."""
+    _lat, _lon, name, region, country = place
+    return ", ".join(p for p in (name, region, country) if p)
+
+class CitySuggester:
+    """Type-ahead for the city box, cheapest source first.
+
+    local(text) answers from previous searches (geocode cache) and the offline gazetteer
+    and costs no network. lookup(text, callback) is for text the user has stopped editing
+    that nothing local matched: it geocodes online on the refresh pool, unless the text is
+    short or already known not to exist. Every lookup (and cancel()) supersedes the one
+    before it: a queued call is dropped and a running one's answer is discarded, so a
+    stale result never reaches the screen.
+    """
+
+    def __init__(self, pool, limit=SUGGEST_LIMIT):
+        self.pool = pool
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._gen = 0
+        self._future = None
+        self._stats = {"typed": 0, "local": 0, "lookups": 0, "network": 0, "cancelled": 0, "stale": 0}
+
+    def local(self, text):
+        """Suggestions without a network call: cached searches, then the gazetteer's most populous matches."""
+        with self._lock:
+            self._stats["typed"] += 1
+        if len(normalize_city_query(text)) < SUGGEST_MIN_CHARS:
+            return []
+        out = geocode_cache.suggest(text, self.limit)
+        try:
+            from gazetteer import gazetteer
+            places = gazetteer.suggest(text, self.limit)
+        except Exception:
+            places = []
+        seen = {(round(p[0], 1), round(p[1], 1)) for p in out}
+        for p in places:
+            if len(out) >= self.limit:
+                break
+            if (round(p[0], 1), round(p[1], 1)) not in seen:
+                seen.add((round(p[0], 1), round(p[1], 1)))
+                out.append(p)
+        if out:
+            with self._lock:
+                self._stats["local"] += 1
+        return out
+
+    def cancel(self):
+        """Supersede the current lookup (the text changed again)."""
+        with self._lock:
+            self._gen += 1
+            fut, self._future = self._future, None
+        if fut is not None and not fut.done():
+            fut.cancel()
+            with self._lock:
+                self._stats["cancelled"] += 1
+
+    def lookup(self, text, callback):
+        """Geocode settled `text` that local() had nothing for; callback(text, suggestions) from a worker
+        thread unless superseded. Returns the Future, or None when no network call was needed."""
+        self.cancel()
+        with self._lock:
+            self._stats["lookups"] += 1
+            gen = self._gen
+        if len(normalize_city_query(text)) < SUGGEST_NETWORK_MIN_CHARS or geocode_cache.get(text) is not GeocodeCache.MISS:
+            return None  # too short, or a search we already know the answer to
+
+        def run():
+            with self._lock:
+                if gen != self._gen:
+                    return None
+                self._stats["network"] += 1
+            res = owm_geocode_suggestions(text, OWM_API_KEY, self.limit) or []
+            with self._lock:
+                current = gen == self._gen
+                if not current:
+                    self._stats["stale"] += 1
+            if current:
+                callback(text, res)
+            return res
+        fut = self.pool.submit(run, priority=PRIORITY_USER, replace_key="suggest")
+        with self._lock:
+            if gen == self._gen:
+                self._future = fut
+        return fut
+
+    def stats(self):
+        """Text changes seen, how many were answered locally, settled lookups, geocoding calls made,
+        lookups cancelled or answered too late, and `avoided`: geocoding calls saved vs one per change."""
+        with self._lock:
+            return dict(self._stats, avoided=self._stats["typed"] - self._stats["network"])
+
+# ---------- Runtime configuration ----------
+def configure(owm_api_key=None, iqair_api_key=None, provider_workers=None, http_pool_size=None, rate_limits=None,
+              rate_limit_wait=None):
+    """Set API keys, resize the provider executor / HTTP pools, override provider quotas
+    ({provider: ((calls, per_seconds), ...)}, e.g. for paid plans) and how long calls wait
+    for them ({provider: seconds}); empty values keep the current setting."""
+    global OWM_API_KEY, IQAIR_API_KEY, PROVIDER_WORKERS, HTTP_POOL_SIZE, _provider_pool, _http
+    if owm_api_key:
+        OWM_API_KEY = owm_api_key
+    if iqair_api_key:
+        IQAIR_API_KEY = iqair_api_key
+    if provider_workers and provider_workers != PROVIDER_WORKERS:
+        PROVIDER_WORKERS = provider_workers
+        with _provider_pool_lock:
+            old, _provider_pool = _provider_pool, None
+        if old is not None:
+            old.shutdown(wait=False)
+    if http_pool_size and http_pool_size != HTTP_POOL_SIZE:
+        HTTP_POOL_SIZE = http_pool_size
+        with _http_lock:
+            _http = None
+    if rate_limits:
+        rate_limiter.set_limits(rate_limits)
+    if rate_limit_wait:
+        RATE_LIMIT_WAIT.update(rate_limit_wait)